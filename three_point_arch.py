@@ -53,7 +53,7 @@ Possible To-Do
 [_] Option to manually set distance between arch edges (spacebar pause menu?)
 [_] Option to "roll back" arch distance?
 [_] Option to add an arch "base/support wall" before/after creating arch?
-[_] Option to change arch types (circular, equilateral, parabolic, etc)
+[X] Option to change arch types (circular, equilateral, parabolic, etc)
 [_] Use curves instead of vertex plotting?
 [_] Option to have normals either inside or outside?
 [_] Make previous measurments always visible (like with np_float_box)
@@ -74,20 +74,34 @@ bl_info = {
 # Additional credits:
 # Help \ shortcut menu system adapted from NP Station
 
+import argparse
+import json
+import sys
+from collections import OrderedDict
 from copy import deepcopy
-from math import pi, degrees, radians, sin
+from types import SimpleNamespace
+from math import degrees, sin
+from time import perf_counter
+
+import numpy as np
 
 import bpy
 import bmesh
 import bgl
 import blf
-from mathutils import geometry, Quaternion, Vector
+from mathutils import geometry, Matrix, Vector
+try:
+    from mathutils.bvhtree import BVHTree
+except ImportError:  # Blender older than 2.76
+    BVHTree = None
+from bpy.app.handlers import persistent
 from bpy_extras import view3d_utils
 from bpy_extras.view3d_utils import location_3d_to_region_2d as loc3d_to_reg2d
 from bpy_extras.view3d_utils import region_2d_to_vector_3d as reg2d_to_vec3d
 from bpy_extras.view3d_utils import region_2d_to_location_3d as reg2d_to_loc3d
 from bpy_extras.view3d_utils import region_2d_to_origin_3d as reg2d_to_org3d
-from bpy.props import IntProperty, BoolProperty
+from bpy.props import (IntProperty, BoolProperty, FloatProperty,
+        FloatVectorProperty, CollectionProperty, EnumProperty, StringProperty)
 
 #print("Loaded: Three Point Arc Tool\n")  # debug
 
@@ -104,6 +118,51 @@ from bpy.props import IntProperty, BoolProperty
     EXIT
 ) = range(9)
 
+STAGE_NAMES = {PLACE_1ST: "PLACE_1ST", PLACE_2ND: "PLACE_2ND",
+    PLACE_3RD: "PLACE_3RD", ARCH_EXTRUDE_1: "ARCH_EXTRUDE_1",
+    ARCH_EXTRUDE_2: "ARCH_EXTRUDE_2", EXIT: "EXIT"}
+
+# axis lock keys for fast snapping point placement
+AXIS_KEYS = {
+    'X': Vector((1, 0, 0)),
+    'Y': Vector((0, 1, 0)),
+    'Z': Vector((0, 0, 1))}
+
+# keys for typing exact thickness / depth values
+NUM_KEYS = {
+    'ZERO': '0', 'ONE': '1', 'TWO': '2', 'THREE': '3', 'FOUR': '4',
+    'FIVE': '5', 'SIX': '6', 'SEVEN': '7', 'EIGHT': '8', 'NINE': '9',
+    'PERIOD': '.', 'MINUS': '-'}
+
+# adaptive tessellation, see arch_tess_stats
+TESS_REF_CNT = 64  # segments the arch is measured with
+MIN_SEGM_CNT = 4  # enough for every profile
+MAX_SEGM_CNT = 1024
+PREVIEW_PX_TOL = 0.5  # preview chord deviation in region pixels
+
+# dense arches, see decimate_arch and bmesh_from_arch_data_bulk
+SEGM_CNT_LIMIT = 1000000  # typed / stepped segment count
+PREVIEW_MAX_SEGM = 2048  # segments drawn or solved for the live preview
+BULK_VERT_CNT = 4096  # edit mesh inserts above this go through a mesh
+
+# arch profile families, see PROFILES
+PROFILE_ITEMS = (
+    ('CIRCULAR', "Circular", "Single circular segment"),
+    ('POINTED', "Pointed", "Two centred gothic arch, rise above half "
+        "the span"),
+    ('ELLIPTICAL', "Elliptical", "Half ellipse"),
+    ('PARABOLIC', "Parabolic", "Parabola"),
+    ('THREE_CENTRED', "Three-centred", "Basket handle arch, rise below "
+        "half the span"),
+    ('FOUR_CENTRED', "Four-centred", "Tudor arch with a pointed crown"),
+    ('CATENARY', "Catenary", "Inverted hanging chain"))
+
+SEGM_MODE_ITEMS = (
+    ('COUNT', "Count", "Fixed number of segments"),
+    ('CHORD', "Chord tolerance", "Enough segments to keep edges within "
+        "the chord tolerance of the curve"),
+    ('LENGTH', "Edge length", "Segments of about the target edge length"))
+
 
 class Colr:
     red   = 1.0, 0.0, 0.0, 0.5
@@ -152,12 +211,65 @@ class TPARCH_prefs(bpy.types.AddonPreferences):
         name="Arch segments",
         description="Number of segments in arch",
         min=2,
+        max=SEGM_CNT_LIMIT,
         default=16)
 
+    profile = EnumProperty(name="Profile",
+        description="Arch profile placed by the modal tool",
+        items=PROFILE_ITEMS,
+        default='CIRCULAR')
+
+    segm_mode = EnumProperty(name="Segments",
+        description="How the number of arch segments is picked",
+        items=SEGM_MODE_ITEMS,
+        default='COUNT')
+
+    chord_tol = FloatProperty(name="Chord tolerance",
+        description="Largest distance between arch edges and the curve",
+        min=0.00001,
+        default=0.001,
+        subtype='DISTANCE')
+
+    edge_len = FloatProperty(name="Edge length",
+        description="Target length of arch edges",
+        min=0.0001,
+        default=0.1,
+        subtype='DISTANCE')
+
     extr_enabled = BoolProperty(name="Enable extrude",
         description="Extrude arch after edge creation",
         default=True)
 
+    fast_snap = BoolProperty(name="Fast snapping",
+        description="Place points with the add-on's own vertex snapping "
+            "index (CTRL to snap) instead of the transform tool",
+        default=False)
+
+    surface_snap = BoolProperty(name="Place on surfaces",
+        description="With fast snapping, place points on the surface "
+            "under the mouse instead of the view plane",
+        default=False)
+
+    direct_solid = BoolProperty(name="Direct solid",
+        description="Set arch thickness and depth as numbers and build the "
+            "solid in one step instead of with extrude operators",
+        default=True)
+
+    profiling = BoolProperty(name="Profiling",
+        description="Time the modal tool's hot paths and count operator "
+            "calls while it runs",
+        default=False)
+
+    profiling_overlay = BoolProperty(name="Show profiling",
+        description="Draw the profiling results in the 3D View",
+        default=False)
+
+    profiling_path = StringProperty(name="Profiling export",
+        description="JSON file the profiling results are written to when "
+            "the tool exits, nothing is written when empty",
+        default="",
+        subtype='FILE_PATH')
+
     def draw(self, context):
         layout = self.layout
         # split 50 / 50, then split 50 to 60 / 40
@@ -172,7 +284,23 @@ class TPARCH_prefs(bpy.types.AddonPreferences):
         row2 = layout.row()
         r2_sl = row2.split(percentage=0.5)
         r2_sl.prop(self, "segm_cnt")  # 50%
+        r2_sl.prop(self, "profile", text="")
+        r2_sl.prop(self, "segm_mode", text="")
+        if self.segm_mode == 'CHORD':
+            r2_sl.prop(self, "chord_tol")
+        elif self.segm_mode == 'LENGTH':
+            r2_sl.prop(self, "edge_len")
         r2_sl.prop(self, "extr_enabled", text="Enable extrude")
+        r2_sl.prop(self, "direct_solid", text="Direct solid")
+        r2_sl.prop(self, "fast_snap", text="Fast snapping")
+        r2_sl.prop(self, "surface_snap", text="Place on surfaces")
+
+        row3 = layout.row()
+        row3.prop(self, "profiling")
+        sub = row3.row()
+        sub.active = self.profiling
+        sub.prop(self, "profiling_overlay")
+        sub.prop(self, "profiling_path", text="")
         #r2_sl_s = r2_sl.split(percentage=0.3)
         #r2_sl_s.label(text="Color scheme")
         #r2_sl_s.prop(self, "np_col_scheme")
@@ -191,7 +319,8 @@ def backup_blender_settings():
         deepcopy(bpy.context.space_data.transform_orientation),
         deepcopy(bpy.context.space_data.show_manipulator),
         deepcopy(bpy.context.scene.cursor_location),
-        deepcopy(bpy.context.tool_settings.mesh_select_mode[:])]
+        deepcopy(bpy.context.tool_settings.mesh_select_mode[:]),
+        deepcopy(bpy.context.user_preferences.edit.undo_steps)]
     return backup
 
 
@@ -203,10 +332,15 @@ def init_blender_settings():
     bpy.context.space_data.transform_orientation = 'GLOBAL'
     bpy.context.space_data.show_manipulator = False
     bpy.context.tool_settings.mesh_select_mode = True, False, False
+    # no undo pushes from the grabs, extrudes and mode switches during
+    # the session, TPARCH_OT_modal pushes a single step when it finishes
+    bpy.context.user_preferences.edit.undo_steps = 0
     return
 
 
 def restore_blender_settings(backup):
+    # undo first, it is a user preference and outlives the session
+    bpy.context.user_preferences.edit.undo_steps = deepcopy(backup[8])
     bpy.context.tool_settings.use_snap = deepcopy(backup[0])
     bpy.context.tool_settings.snap_element = deepcopy(backup[1])
     bpy.context.tool_settings.snap_target = deepcopy(backup[2])
@@ -218,10 +352,444 @@ def restore_blender_settings(backup):
     return
 
 
+# === Profiling ===
+# Opt-in timing of the modal tool's hot paths. profiler is reset at the
+# start of every modal session and does nothing unless enabled, timer
+# then hands out a shared no-op context manager.
+
+# upper bounds (ms) of the draw time histogram bins, last bin is open
+FRAME_HIST_MS = (1, 2, 4, 8, 16, 33, 66)
+
+
+class ProfileTimer:
+    def __init__(self, prof, name):
+        self.prof = prof
+        self.name = name
+        self.secs = 0.0
+
+    def __enter__(self):
+        self.beg = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.secs = perf_counter() - self.beg
+        self.prof.add_time(self.name, self.secs)
+
+
+class NullTimer:
+    secs = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class SessionProfiler:
+    def __init__(self):
+        self.null_timer = NullTimer()
+        self.reset(False)
+
+    def reset(self, enabled):
+        self.enabled = enabled
+        self.beg = perf_counter()
+        self.timings = {}  # name : [calls, total secs, max secs]
+        self.counts = {}  # name : calls
+        self.frame_hist = [0] * (len(FRAME_HIST_MS) + 1)
+
+    def timer(self, name):
+        if not self.enabled:
+            return self.null_timer
+        return ProfileTimer(self, name)
+
+    def add_time(self, name, secs):
+        stat = self.timings.get(name)
+        if stat is None:
+            stat = self.timings[name] = [0, 0.0, 0.0]
+        stat[0] += 1
+        stat[1] += secs
+        stat[2] = max(stat[2], secs)
+
+    def count(self, name):
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def add_frame(self, secs):
+        ms = secs * 1000
+        i = 0
+        while i < len(FRAME_HIST_MS) and ms > FRAME_HIST_MS[i]:
+            i += 1
+        self.frame_hist[i] += 1
+
+    def report(self):
+        return {
+            "session_secs": perf_counter() - self.beg,
+            "timings": {name: {"calls": c, "total_ms": t * 1000,
+                    "mean_ms": t * 1000 / c, "max_ms": m * 1000}
+                    for name, (c, t, m) in self.timings.items()},
+            "counts": dict(self.counts),
+            # [upper bound ms, frames], the open last bin has no bound
+            "frame_hist": [list(item) for item in
+                    zip(FRAME_HIST_MS + (None,), self.frame_hist)]}
+
+    # Overlay text, slowest paths first.
+    def summary_lines(self):
+        lines = []
+        for name, (c, t, m) in sorted(self.timings.items(),
+                key=lambda item: -item[1][1]):
+            lines.append("%s: %d x %.2f ms (max %.2f)" % (
+                    name, c, t * 1000 / c, m * 1000))
+        if self.counts:
+            lines.append(", ".join("%s %d" % item for item in
+                    sorted(self.counts.items())))
+        lines.append("frames ms " + " ".join("<=%d:%d" % item for item in
+                zip(FRAME_HIST_MS, self.frame_hist)) +
+                " >%d:%d" % (FRAME_HIST_MS[-1], self.frame_hist[-1]))
+        return lines
+
+    def export(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+
+
+profiler = SessionProfiler()
+
+
+# Calls a bpy.ops operator, counting the call for the profiler.
+def run_op(op, *args, **kwargs):
+    profiler.count(op.idname_py())
+    return op(*args, **kwargs)
+
+
+# Draws the profiling summary in the top left corner of the region.
+def draw_profiling(backend, reg):
+    dl = DrawList()
+    y = reg.height - 60
+    for line in profiler.summary_lines():
+        dl.add_text((10, y), line, 11, 72, Colr.white)
+        y -= 15
+    dl.flush(backend)
+
+
+# === Overlay drawing ===
+# Overlay drawing is recorded into a DrawList of batched primitives which
+# is kept between frames and only rebuilt when what it shows changes.
+# Flushing a DrawList hands each batch to a backend, BglBackend draws with
+# bgl / blf, RecordingBackend only counts what would be drawn so overlay
+# cost can be checked without a GPU.
+(
+    PRIM_POINTS,
+    PRIM_LINES,
+    PRIM_QUADS,
+    PRIM_TEXT
+) = range(4)
+
+
+class DrawList:
+    def __init__(self):
+        self.prims = []  # [prim type, draw state, items]
+
+    def clear(self):
+        self.prims = []
+
+    # consecutive primitives sharing type and state go in one batch
+    def add(self, prim_typ, state, items):
+        if self.prims and self.prims[-1][0] == prim_typ and \
+                self.prims[-1][1] == state:
+            self.prims[-1][2].extend(items)
+        else:
+            self.prims.append([prim_typ, state, list(items)])
+
+    def add_points(self, coords, colr, size=10):
+        self.add(PRIM_POINTS, (colr, size), coords)
+
+    # line strips are stored as separate segments so strips of the same
+    # color can be drawn as one GL_LINES batch
+    def add_line_strip(self, coords, colr):
+        coords = list(coords)
+        if len(coords) < 2:
+            return
+        segs = [None] * ((len(coords) - 1) * 2)
+        segs[0::2] = coords[:-1]
+        segs[1::2] = coords[1:]
+        self.add(PRIM_LINES, colr, segs)
+
+    def add_quad(self, coords, colr):
+        self.add(PRIM_QUADS, colr, coords)
+
+    # shadow is None or (blur, shadow color, shadow offset)
+    def add_text(self, pos, txt, size, dpi, colr, shadow=None, font_id=0):
+        self.add(PRIM_TEXT, (font_id, size, dpi, colr, shadow),
+                ((pos[X], pos[Y], txt),))
+
+    def flush(self, backend):
+        for prim_typ, state, items in self.prims:
+            if prim_typ == PRIM_POINTS:
+                backend.draw_points(items, *state)
+            elif prim_typ == PRIM_LINES:
+                backend.draw_lines(items, state)
+            elif prim_typ == PRIM_QUADS:
+                backend.draw_quads(items, state)
+            elif prim_typ == PRIM_TEXT:
+                backend.draw_text(items, *state)
+
+
+class BglBackend:
+    def draw_points(self, coords, colr, size):
+        bgl.glEnable(bgl.GL_BLEND)
+        bgl.glPointSize(size)
+        bgl.glColor4f(*colr)
+        bgl.glBegin(bgl.GL_POINTS)
+        for co in coords:
+            bgl.glVertex2f(co[X], co[Y])
+        bgl.glEnd()
+
+    def draw_lines(self, coords, colr):
+        bgl.glEnable(bgl.GL_BLEND)
+        bgl.glColor4f(*colr)
+        bgl.glBegin(bgl.GL_LINES)
+        for co in coords:
+            bgl.glVertex2f(co[X], co[Y])
+        bgl.glEnd()
+
+    def draw_quads(self, coords, colr):
+        bgl.glColor4f(*colr)
+        bgl.glBegin(bgl.GL_QUADS)
+        for co in coords:
+            bgl.glVertex2f(co[X], co[Y])
+        bgl.glEnd()
+
+    def draw_text(self, runs, font_id, size, dpi, colr, shadow):
+        if shadow is not None:
+            blf.enable(font_id, blf.SHADOW)
+            blf.shadow(font_id, shadow[0], *shadow[1])
+            blf.shadow_offset(font_id, *shadow[2])
+        bgl.glColor4f(*colr)
+        blf.size(font_id, size, dpi)
+        for x, y, txt in runs:
+            blf.position(font_id, x, y, 0)
+            blf.draw(font_id, txt)
+        if shadow is not None:
+            blf.disable(font_id, blf.SHADOW)
+
+
+# Stands in for BglBackend, keeps per-frame primitive and vertex counts.
+class RecordingBackend:
+    def __init__(self):
+        self.frames = []  # one counts dict per finished frame
+        self.curr = None
+        self.begin_frame()
+
+    def begin_frame(self):
+        self.curr = {"batches": 0, "points": 0, "lines": 0, "quads": 0,
+                "text_runs": 0, "verts": 0}
+
+    def end_frame(self):
+        self.frames.append(self.curr)
+        self.begin_frame()
+
+    def record(self, key, cnt, vert_cnt):
+        self.curr["batches"] += 1
+        self.curr[key] += cnt
+        self.curr["verts"] += vert_cnt
+
+    def draw_points(self, coords, colr, size):
+        self.record("points", len(coords), len(coords))
+
+    def draw_lines(self, coords, colr):
+        self.record("lines", len(coords) // 2, len(coords))
+
+    def draw_quads(self, coords, colr):
+        self.record("quads", len(coords) // 4, len(coords))
+
+    def draw_text(self, runs, font_id, size, dpi, colr, shadow):
+        self.record("text_runs", len(runs), 0)
+
+
+# Batched version of loc3d_to_reg2d, projects an N x 3 array of points
+# with one matrix multiply. Returns an N x 2 array of region coordinates
+# and a mask that is False for points behind the view (where
+# loc3d_to_reg2d would return None).
+def loc3d_to_reg2d_arr(reg, rv3d, pts, persp_mat=None):
+    if persp_mat is None:
+        persp_mat = np.array(rv3d.perspective_matrix)
+    pts = np.asarray(pts, dtype=np.float64).reshape(-1, 3)
+    prj = np.dot(pts, persp_mat[:, :3].T) + persp_mat[:, 3]
+    vis = prj[:, 3] > 0.0
+    w = np.where(vis, prj[:, 3], 1.0)
+    half = np.array((reg.width / 2, reg.height / 2))
+    return half + half * prj[:, :2] / w[:, None], vis
+
+
+# Clips the polyline through pts against the near plane and the region
+# bounds in homogeneous clip space and projects what is left. Returns a
+# list of M x 2 arrays, one per visible run of the polyline, so segments
+# outside the view are culled instead of breaking the drawn line strip.
+def clip_polyline_reg2d(reg, persp_mat, pts):
+    pts = np.asarray(pts, dtype=np.float64).reshape(-1, 3)
+    if len(pts) < 2:
+        return []
+    prj = np.dot(pts, persp_mat[:, :3].T) + persp_mat[:, 3]
+    x, y, z, w = prj.T
+    # signed distances to the near, left, right, bottom and top planes
+    dist = np.column_stack((w + z, w + x, w - x, w + y, w - y))
+    d0, d1 = dist[:-1], dist[1:]
+    outside = ((d0 < 0) & (d1 < 0)).any(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_hit = d0 / (d0 - d1)
+    t_beg = np.where((d0 < 0) & (d1 >= 0), t_hit, 0.0).max(axis=1)
+    t_end = np.where((d1 < 0) & (d0 >= 0), t_hit, 1.0).min(axis=1)
+    vis = ~outside & (t_beg <= t_end)
+    vis_idx = np.flatnonzero(vis)
+    if len(vis_idx) == 0:
+        return []
+
+    # a new line strip starts wherever the previous segment was hidden
+    # or either side of the joint was clipped
+    new_strip = np.ones(len(vis), dtype=bool)
+    new_strip[1:] = ~vis[:-1] | (t_end[:-1] < 1.0) | (t_beg[1:] > 0.0)
+    seg_beg = prj[:-1][vis_idx]
+    seg_dir = prj[1:][vis_idx] - seg_beg
+    clip_beg = seg_beg + seg_dir * t_beg[vis_idx, None]
+    clip_end = seg_beg + seg_dir * t_end[vis_idx, None]
+
+    half = np.array((reg.width / 2, reg.height / 2))
+    beg2d = half + half * clip_beg[:, :2] / clip_beg[:, 3:]
+    end2d = half + half * clip_end[:, :2] / clip_end[:, 3:]
+    runs = np.split(np.arange(len(vis_idx)),
+            np.flatnonzero(new_strip[vis_idx])[1:])
+    return [np.vstack((beg2d[r[0]], end2d[r])) for r in runs]
+
+
+# Projects points for the overlay, results for point sets that do not
+# move between frames are kept until the view matrix or region changes.
+class ViewProjector:
+    # reg and rv3d default to the context's, anything with width / height
+    # and a perspective_matrix will do (e.g. for the benchmarks)
+    def __init__(self, reg=None, rv3d=None):
+        self.reg = reg if reg is not None else bpy.context.region
+        self.rv3d = rv3d if rv3d is not None else bpy.context.region_data
+        self.view_key = None
+        self.persp_mat = None
+        self.cache = {}
+        self.cache_max = 32
+
+    # call once per frame before projecting
+    def set_view(self):
+        mat = self.rv3d.perspective_matrix
+        view_key = (self.reg.width, self.reg.height) + \
+                tuple(v for row in mat for v in row)
+        if view_key != self.view_key:
+            self.view_key = view_key
+            self.persp_mat = np.array(mat)
+            self.cache.clear()
+
+    def project(self, pts):
+        return loc3d_to_reg2d_arr(self.reg, self.rv3d, pts, self.persp_mat)
+
+    def project_polyline(self, pts):
+        return clip_polyline_reg2d(self.reg, self.persp_mat, pts)
+
+    # same output as [loc3d_to_reg2d(reg, rv3d, p) for p in pts]
+    def project_list(self, pts):
+        if len(pts) == 0:
+            return []
+        co2d, vis = self.project(pts)
+        return [Vector(c) if v else None for c, v in zip(co2d.tolist(), vis)]
+
+    # Largest region pixels per world unit at any of pts, leaving out how
+    # the perspective divide changes over the unit step. None when every
+    # point is behind the view.
+    def pixel_scale(self, pts):
+        mat = self.persp_mat
+        ws = np.dot(np.asarray(pts, dtype=np.float64), mat[3, :3]) + mat[3, 3]
+        ws = ws[ws > 0]
+        if len(ws) == 0:
+            return None
+        axis_scale = max(self.reg.width * np.sqrt(mat[0, :3].dot(mat[0, :3])),
+                self.reg.height * np.sqrt(mat[1, :3].dot(mat[1, :3])))
+        return float(axis_scale / (2 * ws.min()))
+
+    def project_static(self, pts):
+        pts_key = tuple(tuple(p) for p in pts)
+        pts2d = self.cache.get(pts_key)
+        if pts2d is None:
+            if len(self.cache) >= self.cache_max:
+                self.cache.clear()
+            pts2d = self.project_list(pts)
+            self.cache[pts_key] = pts2d
+        # copies, so callers can't change the cached Vectors
+        return [None if co is None else co.copy() for co in pts2d]
+
+
+# Bounded least recently used cache, lookup returns None on a miss.
+class LRUCache:
+    def __init__(self, max_items=512):
+        self.max_items = max_items
+        self.items = OrderedDict()
+
+    def lookup(self, key):
+        val = self.items.get(key)
+        if val is not None:
+            self.items.move_to_end(key)
+        return val
+
+    def store(self, key, val):
+        self.items[key] = val
+        if len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+        return val
+
+
+# LRU cache of blf text measurements and help text line wraps, keyed on
+# (text, font size, dpi, max width, font id) so HUD layout updates after
+# a pause toggle or region resize are mostly lookups.
+class TextLayoutCache(LRUCache):
+
+    def dimensions(self, txt, size, dpi, font_id=0):
+        key = txt, size, dpi, None, font_id
+        dims = self.lookup(key)
+        if dims is None:
+            blf.size(font_id, size, dpi)
+            dims = self.store(key, tuple(blf.dimensions(font_id, txt)))
+        return dims
+
+    # Splits txt at commas into at most 2 lines, the first line is filled
+    # up to max_wid and anything that does not fit on the second is cut.
+    def wrap(self, txt, size, dpi, max_wid, font_id=0):
+        key = txt, size, dpi, max_wid, font_id
+        lines = self.lookup(key)
+        if lines is not None:
+            return list(lines)
+        str_segs = txt.split(',')
+        out_str = ['']
+        str_cnt = 0  # text string count
+        seg_cnt = len(str_segs)
+        re_add = ([','] * (seg_cnt - 1)) + ['']
+        for i in range(seg_cnt):
+            tmp_str = str_segs[i] + re_add[i]
+            tmp_wid = self.dimensions(tmp_str, size, dpi, font_id)[0]
+            os_wid = self.dimensions(out_str[str_cnt], size, dpi, font_id)[0]
+            if (os_wid + tmp_wid) > max_wid:
+                if str_cnt > 0:
+                    break
+                else:
+                    out_str.append('')
+                    tmp_str = tmp_str.strip()
+                    str_cnt += 1
+            out_str[str_cnt] += tmp_str
+        return list(self.store(key, tuple(out_str)))
+
+
+text_layout = TextLayoutCache()
+
+
 class DrawMeanDistance:
-    def __init__(self, sz, settings):
+    def __init__(self, sz, settings, proj):
         self.reg = bpy.context.region
-        self.rv3d = bpy.context.region_data
+        self.proj = proj
         self.dpi = bpy.context.user_preferences.system.dpi
         self.size = sz
         self.txtcolr = settings["col_num_main"]
@@ -229,7 +797,7 @@ class DrawMeanDistance:
         self.shdoffs = -1, -1  # shadow offset
         self.font_id = 0
 
-    def draw(self, pts, meas_mult, meas_suff):
+    def draw(self, dl, pts, meas_mult, meas_suff):
         pts_3d = []
         for i in range(len(pts)):
             if type(pts[i]) is not Vector:
@@ -237,10 +805,9 @@ class DrawMeanDistance:
             else:
                 pts_3d.append(pts[i])
 
-        p1_2d = loc3d_to_reg2d(self.reg, self.rv3d, pts_3d[0])
-        p2_2d = loc3d_to_reg2d(self.reg, self.rv3d, pts_3d[1])
+        p1_2d, p2_2d = self.proj.project_list(pts_3d[:2])
 
-        draw_line_2D(p1_2d, p2_2d, Colr.white)
+        draw_line_2D(dl, p1_2d, p2_2d, Colr.white)
 
         if p1_2d is None or p2_2d is None:
             p1_2d = p2_2d = 0.0, 0.0
@@ -265,16 +832,8 @@ class DrawMeanDistance:
         #print("self.txtcolr", self.txtcolr)  # debug
 
         if dist_3d_rnd != 0:
-            blf.enable(self.font_id, blf.SHADOW)
-            blf.shadow(self.font_id, shdblr, *self.shdcolr)
-            blf.shadow_offset(self.font_id, *self.shdoffs)
-
-            bgl.glColor4f(*self.txtcolr)
-            blf.size(self.font_id, self.size, self.dpi)
-            blf.position(self.font_id, dist_loc[0], dist_loc[1], 0)
-            blf.draw(self.font_id, dist)
-
-            blf.disable(self.font_id, blf.SHADOW)
+            dl.add_text(dist_loc, dist, self.size, self.dpi, self.txtcolr,
+                    (shdblr, self.shdcolr, self.shdoffs), self.font_id)
 
         # To-Do : if displaying measurements for multiple dimensions
         # at once is needed, may have to uncomment below return
@@ -298,34 +857,29 @@ class DrawSegmCounter:
 
         d_b_offs =  Vector((10, 24))  # description base offset
         c_b_offs =  Vector((5, 6))  # count base offset
-        blf.size(self.font_id, self.desc_size, self.dpi)
-        desc_dim = Vector(blf.dimensions(self.font_id, self.desc_str))
+        desc_dim = Vector(text_layout.dimensions(self.desc_str,
+                self.desc_size, self.dpi, self.font_id))
 
         #desc_x_hf =
         self.desc_co_offs = Vector((-desc_dim[X] - d_b_offs[X], d_b_offs[Y]))
         self.seg_cnt_co_offs = Vector((c_b_offs[X], desc_dim[Y] + c_b_offs[Y]))
 
-    def draw(self, cnt, co):
+    def draw(self, dl, cnt, co):
         if co is None:
             return
         desc_co = co + self.desc_co_offs
         seg_cnt_co = desc_co + self.seg_cnt_co_offs
 
-        bgl.glColor4f(*self.desc_colr)
-        blf.size(self.font_id, self.desc_size, self.dpi)
-        blf.position(self.font_id, desc_co[0], desc_co[1], 0)
-        blf.draw(self.font_id, self.desc_str)
-
-        bgl.glColor4f(*self.seg_cnt_colr)
-        blf.size(self.font_id, self.seg_cnt_size, self.dpi)
-        blf.position(self.font_id, seg_cnt_co[0], seg_cnt_co[1], 0)
-        blf.draw(self.font_id, str(cnt))
+        dl.add_text(desc_co, self.desc_str, self.desc_size, self.dpi,
+                self.desc_colr, font_id=self.font_id)
+        dl.add_text(seg_cnt_co, str(cnt), self.seg_cnt_size, self.dpi,
+                self.seg_cnt_colr, font_id=self.font_id)
 
 
 class HelpText:
     def get_size(self):
-        blf.size(self.font_id, self.size, self.dpi)
-        self.wid, self.hgt = blf.dimensions(self.font_id, self.origtxt)
+        self.wid, self.hgt = text_layout.dimensions(self.origtxt, self.size,
+                self.dpi, self.font_id)
 
     def __init__(self, text, size, h_a, colr, shdcolr):
         self.dpi = bpy.context.user_preferences.system.dpi
@@ -348,29 +902,21 @@ class HelpText:
         self.get_size()
 
 
-    def draw_wrapper(self):
+    def draw_wrapper(self, dl):
         if self.viz:
             if self.shad:
                 shdblur = 3  # shadow blur
                 shdoffs = -1, -1
-                blf.enable(self.font_id, blf.SHADOW)
-                blf.shadow(self.font_id, shdblur, *self.shad_colr)
-                blf.shadow_offset(self.font_id, shdoffs[X], shdoffs[Y])
-                self.draw()
-                blf.disable(self.font_id, blf.SHADOW)
+                self.draw(dl, (shdblur, self.shad_colr, shdoffs))
             else:
-                self.draw()
-
-    def draw(self):
-        bgl.glColor4f(*self.colr)
-        blf.size(self.font_id, self.size, self.dpi)
-        p1 = self.pos
-        blf.position(self.font_id, p1[0], p1[1], 0)
-        blf.draw(self.font_id, self.disptxt[0])
+                self.draw(dl)
+
+    def draw(self, dl, shadow=None):
+        dl.add_text(self.pos, self.disptxt[0], self.size, self.dpi,
+                self.colr, shadow, self.font_id)
         if self.ovrfl:
-            p2 = self.ovrfl_pos
-            blf.position(self.font_id, p2[0], p2[1], 0)
-            blf.draw(self.font_id, self.disptxt[1])
+            dl.add_text(self.ovrfl_pos, self.disptxt[1], self.size,
+                    self.dpi, self.colr, shadow, self.font_id)
 
 
 class HelpBar:
@@ -404,9 +950,8 @@ class HelpBar:
             font_id = 0
             sizes = [i.size for i in self.help_txts]
             max_size = max(sizes)
-            blf.size(font_id, max_size, dpi)
-            x, max_y =  blf.dimensions(0, "Tgp")
-            y = blf.dimensions(0, "T")[1]
+            x, max_y = text_layout.dimensions("Tgp", max_size, dpi, font_id)
+            y = text_layout.dimensions("T", max_size, dpi, font_id)[1]
             hgt_mult = 1.6  # multiplier for bar heigt
             self.hgt = int(max_y * hgt_mult)
             self.x_off = int(x / 2)
@@ -445,26 +990,8 @@ class HelpBar:
             helptxt.ovrfl = False
             self.extend = False
         else:
-            font_id = helptxt.font_id
-            str_segs = helptxt.origtxt.split(',')
-            out_str = ['']
-            str_cnt = 0  # text string count
-            seg_cnt = len(str_segs)
-            re_add = ([','] * (seg_cnt - 1)) + ['']
-            blf.size(font_id, helptxt.size, dpi)
-            blf_dim = blf.dimensions
-            for i in range(seg_cnt):
-                tmp_str = str_segs[i] + re_add[i]
-                tmp_wid = blf_dim(font_id, tmp_str)[0]
-                os_wid = blf_dim(font_id, out_str[str_cnt])[0]
-                if (os_wid + tmp_wid) > self.max_txt_wid:
-                    if str_cnt > 0:
-                        break
-                    else:
-                        out_str.append('')
-                        tmp_str = tmp_str.strip()
-                        str_cnt += 1
-                out_str[str_cnt] += tmp_str
+            out_str = text_layout.wrap(helptxt.origtxt, helptxt.size, dpi,
+                    self.max_txt_wid, helptxt.font_id)
             helptxt.disptxt = out_str
             self.barcnt = 2
             helptxt.ovrfl = True
@@ -494,16 +1021,24 @@ class HelpBar:
             top2 = btm2 + self.hgt
             self.bndry[1] = self.get_bar_co(left, right, btm2, top2)
 
-    def draw(self):
-        bgl.glColor4f(*self.colr)
+    def draw(self, dl):
         for b in range(self.barcnt):
-            bgl.glBegin(bgl.GL_TRIANGLE_FAN)
-            for co in self.bndry[b]:
-                bgl.glVertex2f(*co)
-            bgl.glEnd()
+            dl.add_quad(self.bndry[b], self.colr)
 
         for i in self.help_txts:
-            i.draw_wrapper()
+            i.draw_wrapper(dl)
+
+
+# One prebuilt HUD screen, laid out for the region size in layout_key.
+class HelpScreen:
+    def __init__(self, settings):
+        self.instr = None  # instructions
+        self.bartop = HelpBar()  # bar top
+        self.barbot = HelpBar()
+        self.bartop.colr = settings["col_field_keys_aff"]
+        self.barbot.colr = settings["col_field_keys_neg"]
+        self.draw_list = DrawList()
+        self.layout_key = None
 
 
 class HelpDisplay:
@@ -517,25 +1052,43 @@ class HelpDisplay:
         #self.siz = None  # text sizes
         #self.txtcolr = None  # text colors
         self.pos = None  # text positions
+        self.screens = {}  # prebuilt HelpScreens
+        self.curr = None  # current HelpScreen
+        # instr, bartop, barbot and draw_list belong to the current screen
         self.instr = None  # instructions
-        self.bartop = HelpBar()  # bar top
-        self.barbot = HelpBar()
+        self.bartop = None  # bar top
+        self.barbot = None
+        self.draw_list = None  # rebuilt by update
         self.bar_w = 0  # bar width
         self.viz = False  # is gui visible?
         self.dispbars = False  # display bars?
         self.settings = settings
 
-        self.bartop.colr = self.settings["col_field_keys_aff"]
-        self.barbot.colr = self.settings["col_field_keys_neg"]
+        # overlapping tool and UI regions narrow the usable view, the
+        # regions and draw settings do not change while the add-on runs
+        # so they are only looked up once
+        self.rtools = None
+        self.rui = None
+        system = bpy.context.user_preferences.system
+        if system.use_region_overlap and bpy.context.area is not None:
+            if system.window_draw_method in ('TRIPLE_BUFFER', 'AUTOMATIC'):
+                for r in bpy.context.area.regions:
+                    if r.type == 'TOOLS':
+                        self.rtools = r
+                    elif r.type == 'UI':
+                        self.rui = r
 
-    # always have to do full update after string change as
-    # there is no guarantee string will not be split
-    def clear_str(self):
-        self.instr = None
-        self.bartop.help_txts = []
-        self.bartop.txtcnt = 0
-        self.barbot.help_txts = []
-        self.barbot.txtcnt = 0
+    # starts a new screen that following add_str calls fill in
+    def new_screen(self, key):
+        self.screens[key] = HelpScreen(self.settings)
+        self.set_screen(key)
+
+    def set_screen(self, key):
+        self.curr = self.screens[key]
+        self.instr = self.curr.instr
+        self.bartop = self.curr.bartop
+        self.barbot = self.curr.barbot
+        self.draw_list = self.curr.draw_list
 
     def add_str(self, help_typ, txt, size, align, colr=None, shdcolr=None):
         if help_typ == "INS":
@@ -544,6 +1097,7 @@ class HelpDisplay:
             self.instr = HelpText(
                 txt, size, align, colr, shdcolr)
             self.instr.shad = True
+            self.curr.instr = self.instr
         elif help_typ == "TOP":
             colr = self.settings["col_font_keys"]
             self.bartop.help_txts.append(HelpText(
@@ -555,18 +1109,12 @@ class HelpDisplay:
                 txt, size, align, colr, shdcolr))
             self.barbot.txtcnt += 1
 
+    def region_key(self):
+        return self.rtoolsw, self.ruiw, self.rgwid, self.rghgt
+
     def new_vals(self):
-        rtoolsw = 0
-        ruiw = 0
-        system = bpy.context.user_preferences.system
-        if system.use_region_overlap:
-            if system.window_draw_method in ('TRIPLE_BUFFER', 'AUTOMATIC'):
-                area = bpy.context.area
-                for r in area.regions:
-                    if r.type == 'TOOLS':
-                        rtoolsw = r.width
-                    elif r.type == 'UI':
-                        ruiw = r.width
+        rtoolsw = 0 if self.rtools is None else self.rtools.width
+        ruiw = 0 if self.rui is None else self.rui.width
 
         if self.rtoolsw != rtoolsw or self.ruiw != ruiw or \
                 self.rgwid != self.reg.width or self.rghgt != self.reg.height:
@@ -629,79 +1177,71 @@ class HelpDisplay:
         else:
             self.viz = False
 
-    def draw(self):
-        if self.new_vals():
-            self.update()
+        self.draw_list.clear()
         if self.viz:
-            #font_id = 0
             #draw_logo()
-
             if self.dispbars:
-                self.instr.draw_wrapper()
-                self.bartop.draw()
-                self.barbot.draw()
-
-
-def get_rotated_pt(piv_co, mov_co, ang_rad, piv_norm):
-    mov_aligned = mov_co - piv_co
-    rot_val = Quaternion(piv_norm, ang_rad)
-    mov_aligned.rotate(rot_val)
-    return mov_aligned + piv_co
+                self.instr.draw_wrapper(self.draw_list)
+                self.bartop.draw(self.draw_list)
+                self.barbot.draw(self.draw_list)
+        self.curr.layout_key = self.region_key()
+
+    def draw(self, backend):
+        # screens are only laid out again after a region change
+        if self.new_vals() or self.curr.layout_key != self.region_key():
+            self.update()
+        self.draw_list.flush(backend)
 
 
-def draw_pt_2D(pt_co, pt_color):
+def draw_pt_2D(dl, pt_co, pt_color):
     if pt_co is not None:
-        bgl.glEnable(bgl.GL_BLEND)
-        bgl.glPointSize(10)
-        bgl.glColor4f(*pt_color)
-        bgl.glBegin(bgl.GL_POINTS)
-        bgl.glVertex2f(*pt_co)
-        bgl.glEnd()
+        dl.add_points((pt_co,), pt_color)
     return
 
 
-def draw_line_2D(pt_co_1, pt_co_2, pt_color):
+def draw_line_2D(dl, pt_co_1, pt_co_2, pt_color):
     if None not in (pt_co_1, pt_co_2):
-        bgl.glEnable(bgl.GL_BLEND)
-        bgl.glPointSize(7)
-        bgl.glColor4f(*pt_color)
-        bgl.glBegin(bgl.GL_LINE_STRIP)
-        bgl.glVertex2f(*pt_co_1)
-        bgl.glVertex2f(*pt_co_2)
-        bgl.glEnd()
+        dl.add_line_strip((pt_co_1, pt_co_2), pt_color)
     return
 
 
-def draw_circ_arch_3D(steps, pts, orig, ang_meas, piv_norm, color, reg, rv3d):
-    orig2d = loc3d_to_reg2d(reg, rv3d, orig)
-    # returns None when 3d point is not inside active 3D View
-    if orig2d is not None:
-        draw_pt_2D(orig2d, Colr.white)
-    ang_incr = abs(ang_meas / steps)
-    bgl.glColor4f(*color)
-    bgl.glBegin(bgl.GL_LINE_STRIP)
-    curr_ang = 0.0
-    while curr_ang <= ang_meas:
-        new_pt = get_rotated_pt(orig, pts[0], curr_ang, piv_norm)
-        new_pt2d = loc3d_to_reg2d(reg, rv3d, new_pt)
-        if new_pt2d is not None:
-            bgl.glVertex2f(new_pt2d[X], new_pt2d[Y])
-        curr_ang = curr_ang + ang_incr
-    new_pt2d = loc3d_to_reg2d(reg, rv3d, pts[1])
-    if new_pt2d is not None:
-        bgl.glVertex2f(new_pt2d[X], new_pt2d[Y])
-    bgl.glEnd()
+def draw_circ_arch_3D(dl, arch_pts, orig, color, proj):
+    orig2d = proj.project_static((orig,))[0]
+    # None when 3d point is not inside active 3D View
+    draw_pt_2D(dl, orig2d, Colr.white)
+    for strip in proj.project_polyline(arch_pts):
+        dl.add_line_strip(strip.tolist(), color)
     return
 
 
 # Refreshes mesh drawing in 3D view and updates mesh coordinate
-# data so ref_pts are drawn at correct locations.
-# Using editmode_toggle to do this seems hackish, but editmode_toggle seems
-# to be the only thing that updates both drawing and coordinate info.
-def editmode_refresh(ed_type):
+# data so ref_pts are drawn at correct locations. update_edit_mesh only
+# rewrites the edit mesh's derived data, unlike an editmode_toggle round
+# trip which converts the whole mesh twice.
+# destructive=False when only coordinates or selection changed, lets
+# Blender skip rebuilding the edit mesh's derived data
+def editmode_refresh(ed_type, destructive=True):
     if ed_type == "EDIT_MESH":
-        bpy.ops.object.editmode_toggle()
-        bpy.ops.object.editmode_toggle()
+        profiler.count("update_edit_mesh")
+        bmesh.update_edit_mesh(bpy.context.edit_object.data, tessface=False,
+                destructive=destructive)
+
+
+# Returns the faces connected to verts, walking only the geometry linked
+# to them so large meshes the arch was added into are left untouched.
+def linked_faces(verts):
+    seen = set(verts)
+    todo = list(verts)
+    faces = set()
+    while todo:
+        v = todo.pop()
+        faces.update(v.link_faces)
+        for e in v.link_edges:
+            v_oth = e.other_vert(v)
+            if v_oth not in seen:
+                seen.add(v_oth)
+                todo.append(v_oth)
+    return list(faces)
 
 
 def add_pt(self, co):
@@ -709,12 +1249,42 @@ def add_pt(self, co):
     self.pt_cnt += 1
 
 
+# Edit mesh selection at launch. The tool deselects everything so only
+# its guide vertex and arch get selected, restore_selected selects the
+# saved elements again (those removed meanwhile are skipped).
+class EditSelection():
+    def __init__(self, ob):
+        bm = bmesh.from_edit_mesh(ob.data)
+        self.elems = [elem for seq in (bm.verts, bm.edges, bm.faces)
+                for elem in seq if elem.select]
+
+    def restore_selected(self, ed_type):
+        if ed_type != 'EDIT_MESH':
+            return
+        for elem in self.elems:
+            if elem.is_valid:
+                elem.select = True
+        editmode_refresh(ed_type, destructive=False)
+
+
 # === PointFind code ===
+# The "guide point" is an empty mesh object when the add-on is launched
+# from OBJECT mode and a single vertex added to the edit mesh when it is
+# launched from EDIT_MESH mode. With fast snapping in EDIT_MESH mode the
+# modal moves the point itself, so it is only a coordinate drawn by the
+# overlay and the edit mesh is left alone while it moves.
 class SnapPoint():
-    def __init__(self):
-        self.mode = "OBJECT"
-        self.point = None
-        self.ob = bpy.context.scene.objects
+    def __init__(self, mode="OBJECT", follow=False):
+        self.mode = mode
+        # follow == True when the modal moves the point itself (fast
+        # snapping) instead of handing it to the transform tool
+        self.follow = follow
+        self.surface = None  # SurfaceIndex when placing on surfaces
+        self.point = None  # guide object (OBJECT mode)
+        self.vert = None  # guide vertex (EDIT_MESH mode)
+        self.ob = None  # object the guide vertex belongs to
+        # guide location when it is only a coordinate or was removed
+        self.co = None
         #self.pt_cnt = 0
 
     # todo : move outside SnapPoint ?
@@ -725,6 +1295,11 @@ class SnapPoint():
         # make sure converted mouse location is visible from the 3D view,
         # if not, use less accurate alternative for getting mouses 3D coordinates
         mouse_vec3d = reg2d_to_vec3d(region, rv3d, mouse_loc)
+        if self.surface is not None:
+            hit = self.surface.ray_cast(
+                    reg2d_to_org3d(region, rv3d, mouse_loc), mouse_vec3d)
+            if hit is not None:
+                return hit
         enterloc = reg2d_to_loc3d(region, rv3d, mouse_loc, mouse_vec3d)
         test2d = loc3d_to_reg2d(region, rv3d, enterloc)
         if test2d is None:
@@ -736,22 +1311,30 @@ class SnapPoint():
     def create(self, ms_loc_2d, ed_type):
         ms_loc_3d = self.get_mouse_3d(ms_loc_2d)
         if ed_type == 'OBJECT':
-            bpy.ops.object.add(type='MESH', location=ms_loc_3d)
+            run_op(bpy.ops.object.add, type='MESH', location=ms_loc_3d)
             self.point = bpy.context.object
-        bpy.ops.transform.translate('INVOKE_DEFAULT')
+        elif ed_type == 'EDIT_MESH' and self.follow:
+            self.ob = bpy.context.edit_object
+            self.co = ms_loc_3d.copy()
+        elif ed_type == 'EDIT_MESH':
+            self.ob = bpy.context.edit_object
+            bm = bmesh.from_edit_mesh(self.ob.data)
+            self.vert = bm.verts.new(self.ob.matrix_world.inverted() * ms_loc_3d)
+            self.vert.select = True
+            editmode_refresh(ed_type)
+        if not self.follow:
+            run_op(bpy.ops.transform.translate, 'INVOKE_DEFAULT')
 
     # Makes sure only the "guide point" object or vert
     # added with create is grabbed.
     def grab(self, ed_type, sel_backup=None):
+        if self.follow:
+            return
         if ed_type == 'OBJECT':
-            bpy.ops.object.select_all(action='DESELECT')
+            run_op(bpy.ops.object.select_all, action='DESELECT')
             self.point.select = True
-        elif ed_type == 'EDIT_MESH':
-            bpy.ops.mesh.select_all(action='DESELECT')
-            bm = bmesh.from_edit_mesh(bpy.context.edit_object.data)
-            bm.verts[-1].select = True
-            editmode_refresh(ed_type)
-        bpy.ops.transform.translate('INVOKE_DEFAULT')
+        # in EDIT_MESH mode the guide vert is the only selected element
+        run_op(bpy.ops.transform.translate, 'INVOKE_DEFAULT')
 
     # todo : make "move then grab" function?
     # Makes sure only the "guide point" object or vert
@@ -759,64 +1342,306 @@ class SnapPoint():
     def mouse_grab(self, ms_loc_2d, ed_type, sel_backup=None):
         ms_loc_3d = self.get_mouse_3d(ms_loc_2d)
         if ed_type == 'OBJECT':
-            bpy.ops.object.select_all(action='DESELECT')
+            run_op(bpy.ops.object.select_all, action='DESELECT')
             self.point.select = True
             self.point.location = ms_loc_3d
-        '''
         elif ed_type == 'EDIT_MESH':
-            bpy.ops.mesh.select_all(action='DESELECT')
-            bm = bmesh.from_edit_mesh(bpy.context.edit_object.data)
-            bm.verts[-1].select = True
-            inver_mw = bpy.context.edit_object.matrix_world.inverted()
-            local_co = inver_mw * ms_loc_3d
-            bm.verts[-1].co = local_co
-            editmode_refresh(ed_type)
-        '''
+            self.move(ed_type, ms_loc_3d)
         #snap_co = self.get_co(ms_loc_2d)
         #print("dist moved:", (snap_co - ms_loc_3d).length)  # debug
-        bpy.ops.transform.translate('INVOKE_DEFAULT')
+        if not self.follow:
+            run_op(bpy.ops.transform.translate, 'INVOKE_DEFAULT')
 
     # Makes sure only the "guide point" object or vert
     # added with create is deleted.
     def remove(self, ed_type, sel_backup=None):
+        if self.point is not None or self.vert is not None:
+            self.co = self.get_co(ed_type)
         if ed_type == 'OBJECT':
-            bpy.ops.object.select_all(action='DESELECT')
-            self.point.select = True
-            bpy.ops.object.delete()
-        '''
-        elif ed_type == 'EDIT_MESH':
-            bpy.ops.mesh.select_all(action='DESELECT')
-            bm = bmesh.from_edit_mesh(bpy.context.edit_object.data)
-            bm.verts[-1].select = True
+            if self.point is not None:
+                run_op(bpy.ops.object.select_all, action='DESELECT')
+                self.point.select = True
+                run_op(bpy.ops.object.delete)
+        elif self.vert is not None:
+            bm = bmesh.from_edit_mesh(self.ob.data)
+            if self.vert.is_valid:
+                bm.verts.remove(self.vert)
             editmode_refresh(ed_type)
-            bpy.ops.mesh.delete(type='VERT')
-        '''
         self.point = None
+        self.vert = None
         #sel_backup.restore_selected(ed_type)
 
+    # after remove, the last guide location is returned (the extrude
+    # stages still redraw and handle clicks once the guide is gone)
     def get_co(self, ed_type):
+        if self.point is None and self.vert is None:
+            return self.co.copy()
         if self.mode == 'OBJECT':
             return self.point.location.copy()
+        else:
+            return self.ob.matrix_world * self.vert.co
 
     def move(self, ed_type, new_co):
         if ed_type == 'OBJECT':
             self.point.location = new_co.copy()
+        elif ed_type == 'EDIT_MESH' and self.vert is None:
+            self.co = new_co.copy()
+        elif ed_type == 'EDIT_MESH':
+            self.vert.co = self.ob.matrix_world.inverted() * new_co
+            editmode_refresh(ed_type, destructive=False)
+
+
+# Per-object cache of data built from visible mesh objects. Objects a
+# scene update reports as changed are rebuilt the next time the index is
+# queried, subclasses define what build_tree makes for an object.
+class ObjectIndex:
+    def __init__(self, scene, static=()):
+        self.scene = scene
+        # objects that are indexed once and never rebuilt, e.g. the edit
+        # object the guide vertex is moved around in
+        self.static = set(static)
+        self.skip = set()  # objects never indexed, e.g. the guide object
+        self.trees = {}  # object name : build_tree result
+        self.dirty = {ob.name for ob in scene.objects if self.candidate(ob)}
+        self.rebuild()
+
+    def candidate(self, ob):
+        return ob.type == 'MESH' and ob.is_visible(self.scene)
+
+    # scene_update_post handler
+    def mark_updated(self, scene):
+        for ob in scene.objects:
+            if (ob.is_updated or ob.is_updated_data) and \
+                    ob.name not in self.static and ob.name not in self.skip:
+                self.dirty.add(ob.name)
+
+    def rebuild(self):
+        for name in self.dirty:
+            ob = self.scene.objects.get(name)
+            if ob is None or name in self.skip or not self.candidate(ob):
+                self.trees.pop(name, None)
+            elif name not in self.trees or name not in self.static:
+                self.trees[name] = self.build_tree(ob)
+        self.dirty.clear()
+
+    def build_tree(self, ob):
+        raise NotImplementedError
+
+
+# Screen space index of snapping candidates (vertices and edge midpoints)
+# of visible mesh objects. World positions are gathered per object, and
+# for each view they are projected once and bucketed into a grid of
+# radius sized cells, so a nearest point query looks at the few
+# candidates in the cells around the mouse whatever their depth.
+class SnapIndex(ObjectIndex):
+    def rebuild(self):
+        ObjectIndex.rebuild(self)
+        self.screen_key = None  # view the screen grid was built for
+
+    def build_tree(self, ob):
+        if ob.mode == 'EDIT':
+            # read the edit mesh directly, update_from_editmode would
+            # write the whole of it back to ob.data first
+            bm = bmesh.from_edit_mesh(ob.data)
+            bm.verts.index_update()
+            cos = np.array([v.co[:] for v in bm.verts],
+                    dtype=np.float32).reshape(-1, 3)
+            edge_vts = np.array([(e.verts[0].index, e.verts[1].index)
+                    for e in bm.edges], dtype=np.int32).reshape(-1, 2)
+        else:
+            me = ob.data
+            cos = np.empty(len(me.vertices) * 3, dtype=np.float32)
+            me.vertices.foreach_get("co", cos)
+            cos = cos.reshape(-1, 3)
+            edge_vts = np.empty(len(me.edges) * 2, dtype=np.int32)
+            me.edges.foreach_get("vertices", edge_vts)
+            edge_vts = edge_vts.reshape(-1, 2)
+        mids = (cos[edge_vts[:, 0]] + cos[edge_vts[:, 1]]) / 2
+        return transform_pts(np.array(ob.matrix_world),
+                np.concatenate((cos, mids)))
+
+    # Projects every candidate for the current view, keeps those inside
+    # the region and sorts them by grid cell.
+    def build_screen(self, reg, rv3d, cell):
+        if self.trees:
+            pts = np.concatenate(list(self.trees.values()))
+        else:
+            pts = np.empty((0, 3))
+        co2d, vis = loc3d_to_reg2d_arr(reg, rv3d, pts)
+        vis &= (co2d >= 0).all(axis=1) & (co2d[:, 0] < reg.width) & \
+                (co2d[:, 1] < reg.height)
+        co2d = co2d[vis]
+        self.cols = int(reg.width // cell) + 1
+        cells = (co2d // cell).astype(np.int64)
+        cell_ids = cells[:, 1] * self.cols + cells[:, 0]
+        order = np.argsort(cell_ids, kind='mergesort')
+        self.cell_ids = cell_ids[order]
+        self.screen_pts = pts[vis][order]
+        self.screen_co2d = co2d[order]
+
+    # Returns the candidate closest on screen to mouse_loc, or None if
+    # none is within radius pixels.
+    def nearest(self, mouse_loc, reg, rv3d, radius=15):
+        if self.dirty:
+            self.rebuild()
+        screen_key = (tuple(tuple(r) for r in rv3d.perspective_matrix),
+                reg.width, reg.height, radius)
+        if screen_key != self.screen_key:
+            self.screen_key = screen_key
+            self.build_screen(reg, rv3d, radius)
+        mouse = np.array(mouse_loc[:2], dtype=np.float64)
+        col, row = (mouse // radius).astype(np.int64)
+        idx = []
+        for r in (row - 1, row, row + 1):
+            # the 3 cells of a row are consecutive ids
+            first = r * self.cols + col - 1
+            beg, end = np.searchsorted(self.cell_ids, (first, first + 3),
+                    side='left')
+            idx.extend(range(beg, end))
+        if not idx:
+            return None
+        dists = np.linalg.norm(self.screen_co2d[idx] - mouse, axis=1)
+        best = int(np.argmin(dists))
+        if dists[best] >= radius:
+            return None
+        return Vector(self.screen_pts[idx[best]])
+
+
+# Object space BVH trees of visible mesh objects for placing points on
+# the surface under the mouse.
+class SurfaceIndex(ObjectIndex):
+    def build_tree(self, ob):
+        if ob.mode == 'EDIT':
+            return BVHTree.FromBMesh(bmesh.from_edit_mesh(ob.data))
+        return BVHTree.FromObject(ob, self.scene)
+
+    # Returns the closest surface hit along the ray, or None.
+    def ray_cast(self, ray_org, ray_dir):
+        if self.dirty:
+            self.rebuild()
+        best = None
+        best_dist = None
+        for name, tree in self.trees.items():
+            mw = self.scene.objects[name].matrix_world
+            inv_mw = mw.inverted()
+            loc = tree.ray_cast(inv_mw * ray_org,
+                    inv_mw.to_3x3() * ray_dir)[0]
+            if loc is None:
+                continue
+            loc = mw * loc
+            dist = (loc - ray_org).length
+            if best_dist is None or dist < best_dist:
+                best, best_dist = loc, dist
+        return best
+
+
+# Fast snapping placement: moves the guide point to the mouse, or to the
+# nearest indexed vertex / edge midpoint while CTRL is held, keeping it on
+# the locked axis through the previous point if an axis lock is set.
+def follow_mouse(self, ctrl):
+    snap = self.snap
+    co = snap.get_mouse_3d(self.mouse_loc)
+    if ctrl:
+        snap_co = self.snap_index.nearest(self.mouse_loc, self.reg,
+                self.rv3d)
+        if snap_co is not None:
+            co = snap_co
+    if self.axis_lock is not None and self.prev_co is not None:
+        axis = self.axis_lock
+        if ctrl:
+            co = self.prev_co + axis * (co - self.prev_co).dot(axis)
+        else:
+            ray_org = reg2d_to_org3d(self.reg, self.rv3d, self.mouse_loc)
+            ray_end = ray_org + reg2d_to_vec3d(self.reg, self.rv3d,
+                    self.mouse_loc)
+            hits = geometry.intersect_line_line(ray_org, ray_end,
+                    self.prev_co, self.prev_co + axis)
+            if hits is not None:
+                co = hits[1]
+    snap.move(self.curr_ed_type, co)
+
+
+# Undoes what a session set up outside the overlay: Blender settings
+# (undo first), snapping index handlers and the redraw timer. With
+# remove_guide, as when the tool is cancelled or fails, the guide point
+# and a partly built edit mesh arch are removed as well.
+def end_session(self, remove_guide):
+    restore_blender_settings(self.settings_backup)
+    for index in (self.snap_index, self.snap.surface):
+        if index is not None:
+            bpy.app.handlers.scene_update_post.remove(index.mark_updated)
+    self.snap_index = None
+    self.snap.surface = None
+    if self.redraw_timer is not None:
+        bpy.context.window_manager.event_timer_remove(self.redraw_timer)
+        self.redraw_timer = None
+    if self.start_ed_type == 'OBJECT' and self.curr_ed_type == 'EDIT_MESH':
+        run_op(bpy.ops.object.editmode_toggle)
+        self.curr_ed_type = bpy.context.mode
+    if remove_guide:
+        if self.start_ed_type == 'EDIT_MESH' and self.arch_verts:
+            # remove the partly built arch from the edit mesh
+            bm = bmesh.from_edit_mesh(bpy.context.edit_object.data)
+            geom_verts = set(self.arch_verts)
+            for f in linked_faces(self.arch_verts):
+                geom_verts.update(f.verts)
+            for v in geom_verts:
+                if v.is_valid:
+                    bm.verts.remove(v)
+            self.arch_verts = []
+            editmode_refresh(self.curr_ed_type)
+        self.snap.remove(self.curr_ed_type, self.sel_backup)
+    if self.sel_backup is not None:
+        self.sel_backup.restore_selected(self.curr_ed_type)
 
 
 def exit_addon(self):
-    if self.curr_ed_type == 'EDIT_MESH':
-        bpy.ops.object.editmode_toggle()
-        self.curr_ed_type = bpy.context.mode
-    if self.force_quit:
-        self.force_quit = False
-        self.snap.remove(self.curr_ed_type, self.sel_backup)
+    end_session(self, self.force_quit)
+    self.force_quit = False
     #print("self.curr_ed_type", self.curr_ed_type)  # debug
     #print("self.stage", self.stage)  # debug
-    #print("self.force_quit", self.force_quit)  # debug
-    restore_blender_settings(self.settings_backup)
+    if profiler.enabled and self.prof_path:
+        try:
+            profiler.export(bpy.path.abspath(self.prof_path))
+        except OSError as err:
+            self.report({'WARNING'}, "Profiling export failed: %s" % err)
+    bpy.context.area.tag_redraw()  # clear overlay
     #print("\n\nAdd-On Exited!\n")  # debug
 
 
+# Everything the overlay shows that can be changed by modal events.
+def get_redraw_key(self):
+    return (self.stage, self.paused, self.segm_cnt, len(self.pts),
+            self.snap.get_co(self.curr_ed_type).to_tuple(), self.thick,
+            self.depth)
+
+
+# Requests a 3D View redraw only when the overlay state has changed and
+# at most once per redraw_interval, changes arriving faster than that
+# (mouse move bursts from high polling rate devices) are left pending and
+# flushed by a single timer event.
+def redraw_if_dirty(self, context):
+    redraw_key = get_redraw_key(self)
+    if redraw_key != self.redraw_key:
+        self.redraw_key = redraw_key
+        self.redraw_pending = True
+    if not self.redraw_pending:
+        return
+    now = perf_counter()
+    if now - self.last_redraw >= self.redraw_interval:
+        context.area.tag_redraw()
+        self.last_redraw = now
+        self.redraw_pending = False
+    elif self.redraw_timer is None:
+        self.redraw_timer = context.window_manager.event_timer_add(
+                self.redraw_interval, context.window)
+
+
+def redraw_timer_done(self, context):
+    context.window_manager.event_timer_remove(self.redraw_timer)
+    self.redraw_timer = None
+
+
 def warp_cursor(self, context, dest_co):
     if dest_co is None:
         return
@@ -831,59 +1656,828 @@ def warp_cursor(self, context, dest_co):
         context.window.cursor_warp(*warpco)
 
 
+# Arch profiles. A profile function takes the half span and rise of an
+# arch and a segment count and returns (segm_cnt + 1) x 2 arrays of in-plane
+# samples and offset directions plus the profile's reference point (its
+# circle centre, or the springing line middle). x runs across the span
+# from -half_wid to half_wid and y up from the springing line. Offset
+# directions are outward unit normals, mitred where arcs meet at a point
+# so the extrados stays parallel to the intrados. Profiles return None
+# for rises they cannot be built for.
+
+# Samples circular arcs given as (centre, radius, start angle, end angle,
+# segments) and joins them end to end, mitring the offsets at the joins.
+def sample_arcs(arcs):
+    pts, offs = [], []
+    for cen, radius, ang_beg, ang_end, cnt in arcs:
+        angs = np.linspace(ang_beg, ang_end, cnt + 1)
+        arc_offs = np.column_stack((np.cos(angs), np.sin(angs)))
+        arc_pts = np.asarray(cen, dtype=np.float64) + arc_offs * radius
+        if offs:
+            n1, n2 = offs[-1][-1], arc_offs[0]
+            offs[-1][-1] = (n1 + n2) / (1.0 + n1.dot(n2))
+            arc_pts, arc_offs = arc_pts[1:], arc_offs[1:]
+        pts.append(arc_pts)
+        offs.append(arc_offs)
+    return np.concatenate(pts), np.concatenate(offs)
+
+
+# Splits segm_cnt between a pair of side arcs of length side_len and the
+# middle of the arch, keeping at least mid_min segments for the middle.
+# Returns None when there are not enough segments for every arc.
+def split_segm_cnt(segm_cnt, side_len, total_len, mid_min):
+    side_cnt = max(1, int(round(segm_cnt * side_len / total_len)))
+    side_cnt = min(side_cnt, (segm_cnt - mid_min) // 2)
+    if side_cnt < 1:
+        return None
+    return side_cnt, segm_cnt - 2 * side_cnt
+
+
+def profile_circular(half_wid, rise, segm_cnt):
+    radius = (rise / 2) + (half_wid ** 2) / (2 * rise)
+    cen_to_piv = radius - rise  # negative when arch is over a half circle
+    half_ang = np.arctan2(half_wid, cen_to_piv)
+    cen = (0.0, -cen_to_piv)
+    pts, offs = sample_arcs(((cen, radius, np.pi / 2 + half_ang,
+            np.pi / 2 - half_ang, segm_cnt),))
+    return pts, offs, np.array(cen)
+
+
+# Two centred (gothic) arch, the arcs meet in a point at the crown so the
+# rise has to be more than half the span.
+def profile_pointed(half_wid, rise, segm_cnt):
+    if rise <= half_wid:
+        return None
+    cen_x = (rise ** 2 - half_wid ** 2) / (2 * half_wid)
+    radius = half_wid + cen_x
+    top_ang = np.arctan2(rise, -cen_x)
+    lf_cnt = (segm_cnt + 1) // 2
+    pts, offs = sample_arcs((
+            ((cen_x, 0.0), radius, np.pi, top_ang, lf_cnt),
+            ((-cen_x, 0.0), radius, np.pi - top_ang, 0.0, segm_cnt - lf_cnt)))
+    return pts, offs, np.zeros(2)
+
+
+def profile_elliptical(half_wid, rise, segm_cnt):
+    angs = np.linspace(np.pi, 0.0, segm_cnt + 1)
+    cos_a, sin_a = np.cos(angs), np.sin(angs)
+    pts = np.column_stack((half_wid * cos_a, rise * sin_a))
+    offs = np.column_stack((rise * cos_a, half_wid * sin_a))
+    offs /= np.sqrt((offs * offs).sum(axis=1))[:, None]
+    return pts, offs, np.zeros(2)
+
+
+def profile_parabolic(half_wid, rise, segm_cnt):
+    xs = np.linspace(-half_wid, half_wid, segm_cnt + 1)
+    pts = np.column_stack((xs, rise * (1 - (xs / half_wid) ** 2)))
+    offs = np.column_stack((2 * rise * xs / half_wid ** 2, np.ones_like(xs)))
+    offs /= np.sqrt((offs * offs).sum(axis=1))[:, None]
+    return pts, offs, np.zeros(2)
+
+
+# Three centred (basket handle) arch, haunch arcs of half the rise in
+# radius blend into one flatter crown arc, the rise has to be less than
+# half the span.
+def profile_three_centred(half_wid, rise, segm_cnt):
+    if rise >= half_wid:
+        return None
+    r_hnch = rise / 2
+    hnch_off = half_wid - r_hnch  # haunch centres sit on the springing line
+    # angle above the springing line where haunch and crown arcs meet
+    join_ang = np.pi / 2 - 2 * np.arctan((rise - r_hnch) / hnch_off)
+    r_crwn = r_hnch + hnch_off / np.cos(join_ang)
+    hnch_len = r_hnch * join_ang
+    cnts = split_segm_cnt(segm_cnt, hnch_len,
+            2 * hnch_len + r_crwn * (np.pi - 2 * join_ang), 1)
+    if cnts is None:
+        return None
+    hnch_cnt, crwn_cnt = cnts
+    pts, offs = sample_arcs((
+            ((-hnch_off, 0.0), r_hnch, np.pi, np.pi - join_ang, hnch_cnt),
+            ((0.0, rise - r_crwn), r_crwn, np.pi - join_ang, join_ang,
+                    crwn_cnt),
+            ((hnch_off, 0.0), r_hnch, join_ang, 0.0, hnch_cnt)))
+    return pts, offs, np.zeros(2)
+
+
+# Four centred (Tudor) arch, haunch arcs centred on the springing line
+# blend into two flat crown arcs meeting in a point. Each crown arc is
+# centred below the springing line, half way over to the opposite haunch
+# centre. Works for rises up to about 1.2 times the half span.
+def profile_four_centred(half_wid, rise, segm_cnt):
+    r_hnch = min(half_wid, rise) / 2
+    hnch_off = half_wid - r_hnch
+    # crown arc tangent to the haunch arc at join_ang through the crown,
+    # h * sin(a) - m * cos(a) = r_hnch solved for the join angle a
+    crwn_dx = hnch_off * 1.5  # haunch centre to crown arc centre, across
+    m = ((hnch_off / 2) ** 2 + rise ** 2 - r_hnch ** 2 - crwn_dx ** 2) / \
+            (-2 * crwn_dx)
+    hyp = np.hypot(rise, m)
+    if r_hnch > hyp:
+        return None
+    join_ang = np.arctan2(m, rise) + np.arcsin(r_hnch / hyp)
+    if not 0.0 < join_ang < np.pi / 2:
+        return None
+    cen_dist = crwn_dx / np.cos(join_ang)  # haunch to crown arc centre
+    r_crwn = r_hnch + cen_dist
+    crwn_cen = (hnch_off / 2, -cen_dist * np.sin(join_ang))
+    top_ang = np.arctan2(rise - crwn_cen[1], -crwn_cen[0])
+    hnch_len = r_hnch * join_ang
+    cnts = split_segm_cnt(segm_cnt, hnch_len,
+            2 * (hnch_len + r_crwn * (np.pi - join_ang - top_ang)), 2)
+    if cnts is None:
+        return None
+    hnch_cnt, crwn_cnt = cnts
+    lf_cnt = (crwn_cnt + 1) // 2
+    pts, offs = sample_arcs((
+            ((-hnch_off, 0.0), r_hnch, np.pi, np.pi - join_ang, hnch_cnt),
+            (crwn_cen, r_crwn, np.pi - join_ang, top_ang, lf_cnt),
+            ((-crwn_cen[0], crwn_cen[1]), r_crwn, np.pi - top_ang, join_ang,
+                    crwn_cnt - lf_cnt),
+            ((hnch_off, 0.0), r_hnch, join_ang, 0.0, hnch_cnt)))
+    return pts, offs, np.zeros(2)
+
+
+# Newton solves for the catenary shape parameter t = half_wid / a of
+# y = a * cosh(x / a) through the springing points and crown, cached on
+# span and rise rounded to 4 significant digits. A miss starts from the
+# last solution, which is close while the third point is dragged.
+class CatenaryCache(LRUCache):
+    def __init__(self, max_items=512):
+        LRUCache.__init__(self, max_items)
+        self.last_t = None
+
+    def shape_param(self, half_wid, rise):
+        half_wid = float("%.4g" % half_wid)
+        rise = float("%.4g" % rise)
+        key = half_wid, rise
+        t = self.lookup(key)
+        if t is None:
+            t = self.store(key, self.solve(rise / half_wid))
+        self.last_t = t
+        return t
+
+    # Solves (cosh(t) - 1) / t = ratio. The left side is convex and
+    # increasing, t_hi is always at or right of the root and caps Newton
+    # steps overshooting from a warm start left of the root.
+    def solve(self, ratio, tol=1e-12, max_iter=50):
+        t_hi = min(2 * ratio, 2 * np.log1p(2 * ratio))
+        t = self.last_t
+        if t is None or t > t_hi:
+            t = t_hi
+        for _ in range(max_iter):
+            cosh_m1 = 2 * np.sinh(t / 2) ** 2  # cosh(t) - 1 without cancelling
+            g = cosh_m1 / t - ratio
+            dg = np.sinh(t) / t - cosh_m1 / t ** 2
+            step = g / dg
+            t_new = t - step
+            if t_new <= 0:
+                t_new = t / 2  # stay positive
+            t = min(t_new, t_hi)
+            if abs(step) <= tol * t:
+                break
+        return float(t)
+
+
+catenary_cache = CatenaryCache()
+
+
+# Inverted hanging chain, the line of thrust of an arch carrying only its
+# own weight. Samples are spaced evenly along the curve.
+def profile_catenary(half_wid, rise, segm_cnt):
+    t = catenary_cache.shape_param(half_wid, rise)
+    sinh_t = np.sinh(t)
+    us = np.arcsinh(np.linspace(-sinh_t, sinh_t, segm_cnt + 1))
+    # scaled to pass exactly through the springing points and crown even
+    # though t comes from the rounded span and rise
+    cosh_m1 = 2 * np.sinh(t / 2) ** 2
+    ys = rise * (cosh_m1 - 2 * np.sinh(us / 2) ** 2) / cosh_m1
+    pts = np.column_stack((us * (half_wid / t), ys))
+    slope = rise * t * np.sinh(us) / (half_wid * cosh_m1)
+    offs = np.column_stack((slope, np.ones_like(slope)))
+    offs /= np.sqrt((offs * offs).sum(axis=1))[:, None]
+    return pts, offs, np.zeros(2)
+
+
+PROFILES = {
+    'CIRCULAR': profile_circular,
+    'POINTED': profile_pointed,
+    'ELLIPTICAL': profile_elliptical,
+    'PARABOLIC': profile_parabolic,
+    'THREE_CENTRED': profile_three_centred,
+    'FOUR_CENTRED': profile_four_centred,
+    'CATENARY': profile_catenary}
+
+
+# Solves the arch through springing points p1 and p2 whose rise is set by
+# p3 (height is the distance from the p1-p2 midpoint to p3, on the side of
+# p3) using one of the PROFILES. Returns the profile's reference point,
+# the crown, the pivot normal and (segm_cnt + 1) x 3 arrays of samples
+# from p2 to p1 and their offset directions, or None when the points
+# cannot form an arch of that profile.
+def solve_arch(p1, p2, p3, segm_cnt, profile='CIRCULAR'):
+    p1 = np.asarray(p1, dtype=np.float64)
+    p2 = np.asarray(p2, dtype=np.float64)
+    p3 = np.asarray(p3, dtype=np.float64)
+    cent = (p1 + p2) * 0.5
+    span = p1 - p2
+    half_wid = np.sqrt(span.dot(span)) / 2
+    if half_wid == 0.0:
+        return None
+    span_dir = span / (2 * half_wid)
+    rise_vec = p3 - cent
+    # direction from the springing line towards the arch crown
+    crown_dir = rise_vec - span_dir * rise_vec.dot(span_dir)
+    crown_len = np.sqrt(crown_dir.dot(crown_dir))
+    if crown_len == 0.0:
+        return None
+    crown_dir /= crown_len
+    hgt = np.sqrt(rise_vec.dot(rise_vec))
+    prof = PROFILES[profile](half_wid, hgt, segm_cnt)
+    if prof is None:
+        return None
+    prof_pts, prof_offs, prof_orig = prof
+
+    # profile x runs from p2 to p1, y along crown_dir. Samples then turn
+    # positively about piv_norm, same winding as the circular solver
+    # always used.
+    piv_norm = np.cross(crown_dir, span_dir)
+    arch_pts = cent + np.outer(prof_pts[:, 0], span_dir) + \
+            np.outer(prof_pts[:, 1], crown_dir)
+    arch_offs = np.outer(prof_offs[:, 0], span_dir) + \
+            np.outer(prof_offs[:, 1], crown_dir)
+    arch_pts[0] = p2
+    arch_pts[-1] = p1
+    orig = cent + span_dir * prof_orig[0] + crown_dir * prof_orig[1]
+    return orig, cent + crown_dir * hgt, piv_norm, arch_pts, arch_offs
+
+
+# Measures the arch solved with TESS_REF_CNT segments for adaptive
+# tessellation, returns (largest chord deviation, curve length) or None
+# when the points cannot form an arch of that profile.
+def arch_tess_stats(p1, p2, p3, profile='CIRCULAR'):
+    arch = solve_arch(p1, p2, p3, TESS_REF_CNT, profile)
+    if arch is None:
+        return None
+    arch_pts, arch_offs = arch[3], arch[4]
+    chords = np.diff(arch_pts, axis=0)
+    lens = np.sqrt((chords * chords).sum(axis=1))
+    dirs = chords / lens[:, None]
+    turns = np.arccos(np.clip((dirs[:-1] * dirs[1:]).sum(axis=1), -1, 1))
+    # a chord of length l under an arc turning by a deviates about
+    # l * a / 8 from it. Pointed crowns (mitred offsets) are on the curve
+    # at any segment count and are left out.
+    smooth = (arch_offs[1:-1] * arch_offs[1:-1]).sum(axis=1) < 1 + 1e-9
+    devs = (lens[:-1] + lens[1:]) * turns * smooth / 16
+    return float(devs.max()), float(lens.sum())
+
+
+# Segment count for an arch measured by arch_tess_stats, keeping chords
+# within chord_tol of the curve ('CHORD') or edges about edge_len long
+# ('LENGTH').
+def tess_segm_cnt(stats, segm_mode, chord_tol=0.0, edge_len=0.0):
+    max_dev, curve_len = stats
+    if segm_mode == 'CHORD':
+        # chord deviation falls with the square of the segment count
+        cnt = TESS_REF_CNT * np.sqrt(max_dev / chord_tol)
+    else:
+        cnt = curve_len / edge_len
+    return int(min(max(np.ceil(cnt), MIN_SEGM_CNT), MAX_SEGM_CNT))
+
+
+# Builds vertex, edge and face arrays for one solved arch. arch_pts is the
+# intrados (inner arch edge). A thickness adds the extrados by moving the
+# intrados along arch_offs, a depth extrudes both along piv_norm. Faces
+# are quads wound to point outwards, loose edges are only returned when
+# there are no faces. A negative depth extrudes against piv_norm.
+def arch_solid_data(arch_pts, arch_offs, piv_norm, thick=0.0, depth=0.0):
+    pt_cnt = len(arch_pts)
+    if depth < 0:
+        # extrude the other way by building from the offset copy
+        arch_pts = arch_pts + np.asarray(piv_norm, dtype=np.float64) * depth
+        depth = -depth
+    rings = [arch_pts]
+    if thick > 0:
+        rings.append(arch_pts + arch_offs * thick)
+    if depth > 0:
+        offs = np.asarray(piv_norm, dtype=np.float64) * depth
+        rings += [r + offs for r in rings]
+    verts = np.concatenate(rings)
+
+    beg = np.arange(pt_cnt - 1)
+    end = beg + 1
+    edges = np.empty((0, 2), dtype=np.int64)
+    if thick > 0 and depth > 0:
+        a, b, c, d = (k * pt_cnt for k in range(4))
+        last = pt_cnt - 1
+        faces = np.concatenate((
+            np.column_stack((a + beg, a + end, b + end, b + beg)),  # front
+            np.column_stack((c + beg, d + beg, d + end, c + end)),  # back
+            np.column_stack((a + beg, c + beg, c + end, a + end)),  # intrados
+            np.column_stack((b + beg, b + end, d + end, d + beg)),  # extrados
+            ((a, b, d, c), (a + last, c + last, d + last, b + last))))
+    elif thick > 0 or depth > 0:
+        # single face strip from the intrados to its one copy
+        faces = np.column_stack((beg, end, end + pt_cnt, beg + pt_cnt))
+    else:
+        faces = np.empty((0, 4), dtype=np.int64)
+        edges = np.column_stack((beg, end))
+    return verts, edges, faces
+
+
+# Solves and builds every (p1, p2, p3) row of pts into combined vertex,
+# edge and face arrays. segm_cnts, thick, depth and profiles are either
+# one value for all rows or one value per row. Rows that cannot form an
+# arch are skipped, the returned valid mask marks the rows that were built.
+def batch_arch_data(pts, segm_cnts, thick=0.0, depth=0.0,
+        profiles='CIRCULAR'):
+    pts = np.asarray(pts, dtype=np.float64).reshape(-1, 3, 3)
+    row_cnt = len(pts)
+    segm_cnts = np.broadcast_to(np.asarray(segm_cnts, dtype=np.int64), (row_cnt,))
+    profiles = np.broadcast_to(np.asarray(profiles), (row_cnt,))
+    thick = np.broadcast_to(np.asarray(thick, dtype=np.float64), (row_cnt,))
+    depth = np.broadcast_to(np.asarray(depth, dtype=np.float64), (row_cnt,))
+    valid = np.zeros(row_cnt, dtype=bool)
+    vert_parts = [np.empty((0, 3))]
+    edge_parts = [np.empty((0, 2), dtype=np.int64)]
+    face_parts = [np.empty((0, 4), dtype=np.int64)]
+    v_offs = 0
+    for r in range(row_cnt):
+        if segm_cnts[r] < 2 or thick[r] < 0 or depth[r] < 0:
+            continue
+        arch = solve_arch(pts[r][0], pts[r][1], pts[r][2], int(segm_cnts[r]),
+                str(profiles[r]))
+        if arch is None:
+            continue
+        orig, crown, piv_norm, arch_pts, arch_offs = arch
+        verts, edges, faces = arch_solid_data(
+                arch_pts, arch_offs, piv_norm, thick[r], depth[r])
+        vert_parts.append(verts)
+        edge_parts.append(edges + v_offs)
+        face_parts.append(faces + v_offs)
+        v_offs += len(verts)
+        valid[r] = True
+    return (np.concatenate(vert_parts), np.concatenate(edge_parts),
+            np.concatenate(face_parts), valid)
+
+
+# Writes vertex, edge and quad face arrays into an empty mesh with bulk
+# foreach_set calls, edges used by faces are calculated by Blender.
+def write_mesh_data(me, verts, edges, faces):
+    face_cnt = len(faces)
+    me.vertices.add(len(verts))
+    me.vertices.foreach_set("co", verts.astype(np.float32).ravel())
+    if len(edges) > 0:
+        me.edges.add(len(edges))
+        me.edges.foreach_set("vertices", edges.astype(np.int32).ravel())
+    if face_cnt > 0:
+        me.loops.add(face_cnt * 4)
+        me.loops.foreach_set("vertex_index", faces.astype(np.int32).ravel())
+        me.polygons.add(face_cnt)
+        me.polygons.foreach_set("loop_start",
+                np.arange(0, face_cnt * 4, 4, dtype=np.int32))
+        me.polygons.foreach_set("loop_total",
+                np.full(face_cnt, 4, dtype=np.int32))
+    me.update(calc_edges=face_cnt > 0)
+
+
+# Adds the vertex, edge and face arrays from arch_solid_data to bm,
+# returns the new verts in array order.
+def bmesh_from_arch_data(bm, verts, edges, faces):
+    bm_verts = bm.verts
+    new_verts = [bm_verts.new(co) for co in verts.tolist()]
+    for v1, v2 in edges.tolist():
+        bm.edges.new((new_verts[v1], new_verts[v2]))
+    for face in faces.tolist():
+        bm.faces.new([new_verts[i] for i in face])
+    return new_verts
+
+
+# Bulk version of bmesh_from_arch_data for dense arches, the arrays are
+# written into a temporary mesh with foreach_set and appended to bm with
+# a single from_mesh call. The new elements come in selected, returns the
+# new verts in array order.
+def bmesh_from_arch_data_bulk(bm, verts, edges, faces):
+    tmp_me = bpy.data.meshes.new("tparch_bulk")
+    write_mesh_data(tmp_me, verts, edges, faces)
+    for elems in (tmp_me.vertices, tmp_me.edges, tmp_me.polygons):
+        elems.foreach_set("select", np.ones(len(elems), dtype=bool))
+    old_cnt = len(bm.verts)
+    bm.from_mesh(tmp_me)
+    bpy.data.meshes.remove(tmp_me)
+    bm.verts.ensure_lookup_table()
+    return list(bm.verts[old_cnt:])
+
+
+# Applies a 4x4 matrix (as numpy array) to an N x 3 array of points.
+def transform_pts(mat, pts):
+    return np.dot(pts, mat[:3, :3].T) + mat[:3, 3]
+
+
+# Adds the arch from self.arch_pts to the edit mesh of ob, as edges or as
+# a solid when thick / depth are given, selects only the new elements and
+# returns the new verts (intrados first, from arch start to end).
+def add_arch_to_edit_mesh(self, ob, thick=0.0, depth=0.0):
+    me = ob.data
+    bm = bmesh.from_edit_mesh(me)
+    mw = ob.matrix_world
+    inv_mw = np.array(mw.inverted())
+    local_pts = transform_pts(inv_mw, self.arch_pts)
+    # offsets and normal go to local space unnormalized so thickness and
+    # depth stay world sized
+    local_offs = np.dot(self.arch_offs, inv_mw[:3, :3].T)
+    local_norm = np.dot(inv_mw[:3, :3], np.array(self.piv_norm))
+    verts, edges, faces = arch_solid_data(local_pts, local_offs,
+            local_norm, thick, depth)
+    if len(verts) > BULK_VERT_CNT:
+        new_verts = bmesh_from_arch_data_bulk(bm, verts, edges, faces)
+    else:
+        new_verts = bmesh_from_arch_data(bm, verts, edges, faces)
+        for v in new_verts:
+            v.select = True
+            for e in v.link_edges:
+                e.select = True
+            for f in v.link_faces:
+                f.select = True
+    bmesh.update_edit_mesh(me)
+    return new_verts
+
+
+# Creates a single mesh object holding every valid arch in pts,
+# see batch_arch_data for the argument layout.
+def create_arches(pts, segm_cnts, thick=0.0, depth=0.0, name="Arches",
+        profiles='CIRCULAR'):
+    verts, edges, faces, valid = batch_arch_data(pts, segm_cnts, thick, depth,
+            profiles)
+    me = bpy.data.meshes.new(name)
+    write_mesh_data(me, verts, edges, faces)
+    ob = bpy.data.objects.new(name, me)
+    bpy.context.scene.objects.link(ob)
+    return ob, valid
+
+
+# Public entry point for scripts: vertex, edge and face arrays of an arch
+# on springing points p1, p2 through rise point p3 (all in world space),
+# or None when there are fewer than 2 segments or the points cannot form
+# an arch of that profile. With me, an empty bpy mesh, the arrays are also
+# written into it.
+def make_arch(p1, p2, p3, segments=16, thickness=0.0, depth=0.0,
+        profile='CIRCULAR', me=None):
+    if segments < 2:
+        return None
+    arch = solve_arch(p1, p2, p3, segments, profile)
+    if arch is None:
+        return None
+    piv_norm, arch_pts, arch_offs = arch[2:]
+    verts, edges, faces = arch_solid_data(arch_pts, arch_offs, piv_norm,
+            thickness, depth)
+    if me is not None:
+        write_mesh_data(me, verts, edges, faces)
+    return verts, edges, faces
+
+
+# Object matrix placing a unit span arch (springing points at x = -0.5
+# and x = 0.5, rising along z) on springing points p1, p2 with rise point
+# p3, None when the points cannot form an arch.
+def arch_frame_matrix(p1, p2, p3):
+    p1, p2, p3 = Vector(p1), Vector(p2), Vector(p3)
+    cent = (p1 + p2) / 2
+    span = p2 - p1
+    if span.length == 0:
+        return None
+    x_ax = span.normalized()
+    rise = p3 - cent
+    z_ax = rise - x_ax * rise.dot(x_ax)
+    if z_ax.length == 0:
+        return None
+    z_ax.normalize()
+    rot = Matrix((x_ax, z_ax.cross(x_ax), z_ax)).transposed().to_4x4()
+    return Matrix.Translation(cent) * rot * Matrix.Scale(span.length, 4)
+
+
+# Unit span arch meshes shared by every arch object of the same shape,
+# keyed on (profile, segment count, rise / span, thickness / span,
+# depth / span) with the ratios rounded to 5 significant digits. The
+# placement and uniform scale go in the object matrix. Meshes keep their
+# key in a "tparch_template" property so templates are found again after
+# undo or reloading a file.
+class ArchTemplateCache:
+    def __init__(self):
+        self.meshes = {}  # key : mesh name
+
+    def lookup(self, key):
+        me = bpy.data.meshes.get(self.meshes.get(key, ""))
+        if me is None or me.get("tparch_template") != key:
+            me = None
+            for tmpl in bpy.data.meshes:
+                if tmpl.get("tparch_template") == key:
+                    me = tmpl
+                    break
+            if me is None:
+                return None
+            self.meshes[key] = me.name
+        return me
+
+    # Returns the template mesh for the shape and its origin in unit span
+    # space (see arch_frame_matrix), None when no arch has that shape.
+    def get_mesh(self, profile, segm_cnt, ratio, thick=0.0, depth=0.0):
+        ratio, thick, depth = (float("%.5g" % v)
+                for v in (ratio, thick, depth))
+        key = "%s %d %r %r %r" % (profile, segm_cnt, ratio, thick, depth)
+        me = self.lookup(key)
+        if me is None:
+            self.evict_unused()
+            arch = solve_arch((-0.5, 0.0, 0.0), (0.5, 0.0, 0.0),
+                    (0.0, 0.0, ratio), segm_cnt, profile)
+            if arch is None:
+                return None
+            orig, crown, piv_norm, arch_pts, arch_offs = arch
+            verts, edges, faces = arch_solid_data(arch_pts - orig,
+                    arch_offs, piv_norm, thick, depth)
+            me = bpy.data.meshes.new("Arch")
+            write_mesh_data(me, verts, edges, faces)
+            me["tparch_template"] = key
+            me["tparch_orig"] = orig.tolist()
+            self.meshes[key] = me.name
+        return me, Vector(me["tparch_orig"])
+
+    # Removes templates no object uses any more.
+    def evict_unused(self):
+        for key, name in list(self.meshes.items()):
+            me = bpy.data.meshes.get(name)
+            if me is None or me.get("tparch_template") != key:
+                del self.meshes[key]
+            elif me.users == 0:
+                del self.meshes[key]
+                bpy.data.meshes.remove(me)
+
+    # When an object using a template goes into edit mode, the template's
+    # other users are moved to an unedited copy that takes over as the
+    # template, and the edited object is left as the only user of its
+    # mesh, which stops being a template.
+    def split_edited(self, scene):
+        ob = scene.objects.active
+        if ob is None or ob.mode != 'EDIT' or ob.type != 'MESH':
+            return
+        me = ob.data
+        key = me.get("tparch_template")
+        if key is None:
+            return
+        del me["tparch_template"]
+        self.meshes.pop(key, None)
+        if me.users > 1:
+            # the edit mesh is only written back to me when leaving edit
+            # mode, a copy made now still has the template shape
+            tmpl = me.copy()
+            tmpl["tparch_template"] = key
+            for other in bpy.data.objects:
+                if other.data == me and other != ob:
+                    other.data = tmpl
+            self.meshes[key] = tmpl.name
+
+
+arch_templates = ArchTemplateCache()
+
+
+@persistent
+def split_edited_template(scene):
+    arch_templates.split_edited(scene)
+
+
+# Places an arch on a shared template mesh, on ob when given or else on a
+# new object linked to the scene. Returns the object, or None when the
+# points cannot form an arch.
+def template_arch_object(p1, p2, p3, segm_cnt, profile='CIRCULAR',
+        thick=0.0, depth=0.0, ob=None):
+    mat = arch_frame_matrix(p1, p2, p3)
+    if mat is None:
+        return None
+    p1, p2, p3 = Vector(p1), Vector(p2), Vector(p3)
+    span = (p2 - p1).length
+    ratio = (p3 - (p1 + p2) / 2).length / span
+    tmpl = arch_templates.get_mesh(profile, segm_cnt, ratio, thick / span,
+            depth / span)
+    if tmpl is None:
+        return None
+    me, orig = tmpl
+    if ob is None:
+        ob = bpy.data.objects.new("Arch", me)
+        bpy.context.scene.objects.link(ob)
+    else:
+        ob.data = me
+    ob.matrix_world = mat * Matrix.Translation(orig)
+    unit_pts = (-0.5, 0.0, 0.0), (0.5, 0.0, 0.0), (0.0, 0.0, ratio)
+    tag_arch_object(ob, *(Vector(p) - orig for p in unit_pts))
+    return ob
+
+
+# Preview segment count in the adaptive segment modes, enough to keep the
+# preview within PREVIEW_PX_TOL pixels of the curve in the current view.
+def preview_segm_cnt(self, snap):
+    scale = self.proj.pixel_scale((self.pts[0], self.pts[1], snap))
+    if scale is None:
+        return MIN_SEGM_CNT  # arch is behind the view
+    return tess_segm_cnt(self.tess_stats, 'CHORD', PREVIEW_PX_TOL / scale)
+
+
+# Segment count the arch mesh is built with.
+def final_segm_cnt(self):
+    if self.segm_mode == 'COUNT':
+        return self.segm_cnt
+    return tess_segm_cnt(self.tess_stats, self.segm_mode, self.chord_tol,
+            self.edge_len)
+
+
+# Records an arch's springing points and rise point (object space) on
+# the arch object, arcades are laid out from them.
+def tag_arch_object(ob, p1, p2, p3):
+    ob["tparch_pts"] = [c for p in (p1, p2, p3) for c in p]
+
+
+# World space springing points and rise point of an arch object. Objects
+# not made by the add-on are taken to span their bounding box along
+# local x and rise along local z.
+def get_arch_frame(ob):
+    pts = ob.get("tparch_pts")
+    if pts is not None and len(pts) == 9:
+        pts = list(pts)
+        pts = [Vector(pts[i:i + 3]) for i in (0, 3, 6)]
+    else:
+        bbox = np.array([tuple(c) for c in ob.bound_box])
+        lo, hi = bbox.min(axis=0), bbox.max(axis=0)
+        mid = (lo + hi) / 2
+        pts = [Vector((lo[0], mid[1], lo[2])), Vector((hi[0], mid[1], lo[2])),
+                Vector((mid[0], mid[1], hi[2]))]
+    mw = ob.matrix_world
+    return [mw * p for p in pts]
+
+
+# World space polyline of a curve or mesh object, curves are converted
+# with their current resolution and mesh vertices are taken in order.
+def get_path_pts(scene, path_ob):
+    me = path_ob.to_mesh(scene, True, 'PREVIEW')
+    mw = np.array(path_ob.matrix_world)
+    co = np.empty(len(me.vertices) * 3)
+    me.vertices.foreach_get("co", co)
+    bpy.data.meshes.remove(me)
+    return transform_pts(mw, co.reshape(-1, 3))
+
+
+# Object matrices for an arcade of cnt bays of the arch object with
+# matrix mat and world frame p1, p2, p3 (see get_arch_frame), the first
+# bay being the arch itself. Bays follow on past p2, pitch apart (the
+# span when 0), or are spread evenly from start to end of the polyline
+# path_pts, standing upright with their span along the path.
+def arcade_matrices(mat, p1, p2, p3, cnt, pitch=0.0, path_pts=None):
+    span = p2 - p1
+    span_dir = span.normalized()
+    if path_pts is None:
+        step = span_dir * (pitch if pitch > 0 else span.length)
+        return [Matrix.Translation(step * i) * mat for i in range(cnt)]
+
+    cent = (p1 + p2) / 2
+    up = p3 - cent
+    up = (up - span_dir * up.dot(span_dir)).normalized()
+    path_pts = np.asarray(path_pts, dtype=np.float64)
+    segs = np.diff(path_pts, axis=0)
+    seg_lens = np.sqrt((segs * segs).sum(axis=1))
+    used = seg_lens > 0  # skip doubled path points
+    if not used.any():
+        return []
+    starts, segs, seg_lens = path_pts[:-1][used], segs[used], seg_lens[used]
+    dists = np.concatenate(([0.0], np.cumsum(seg_lens)))
+    bay_dists = np.linspace(0.0, dists[-1], cnt)
+    ids = np.clip(np.searchsorted(dists, bay_dists, side='right') - 1,
+            0, len(segs) - 1)
+    fracs = (bay_dists - dists[ids]) / seg_lens[ids]
+    locs = starts[ids] + segs[ids] * fracs[:, None]
+    tangs = segs[ids] / seg_lens[ids][:, None]
+
+    to_cent = Matrix.Translation(-cent) * mat
+    mats = []
+    for loc, tang in zip(locs.tolist(), tangs.tolist()):
+        # turn about the arch's up axis only so bays on sloped or vertical
+        # path parts do not tip over
+        tang = Vector(tang)
+        ang = np.arctan2(span_dir.cross(tang).dot(up), span_dir.dot(tang))
+        rot = Matrix.Rotation(ang, 4, up)
+        mats.append(Matrix.Translation(Vector(loc)) * rot * to_cent)
+    return mats
+
+
 # called when self.stage == PLACE_3RD
 def update_arch(self, snap):
     if self.paused:
         return
 
-    self.piv_norm = geometry.normal(self.pts[0], self.cent, snap)
+    pts_key = (snap.to_tuple(), self.profile,
+            tuple(p.to_tuple() for p in self.pts))
+    if self.segm_mode == 'COUNT':
+        # dense arches are previewed with fewer segments, the full count
+        # is solved once the arch is placed
+        segm_cnt = min(self.segm_cnt, PREVIEW_MAX_SEGM)
+    else:
+        # the arch is only measured again when its points change, view
+        # changes just pick a new count from the measurements
+        if pts_key != self.tess_key:
+            self.tess_key = pts_key
+            self.tess_stats = arch_tess_stats(self.pts[0], self.pts[1],
+                    snap, self.profile)
+        if self.tess_stats is None:
+            self.bad_input = True
+            self.arch_key = None  # solve again when the points come back
+            return
+        segm_cnt = preview_segm_cnt(self, snap)
+
+    # only solve again when an input changed, keeps redraws during
+    # view navigation from resampling the whole arch
+    arch_key = pts_key, segm_cnt
+    if arch_key == self.arch_key:
+        return
+    self.arch_key = arch_key
 
-    # exit function if piv_norm or snap have values that prevent rotations
-    if self.piv_norm == Vector() or snap in self.pts:
+    arch = solve_arch(self.pts[0], self.pts[1], snap, segm_cnt, self.profile)
+    if arch is None:
         self.bad_input = True
         return
     else:
         self.bad_input = False
-
-    # create pos and neg endpoints for determining where to create arch
-    rot_pos, rot_neg = self.mov_aligned.copy(), self.mov_aligned.copy()
-    rot_pos.rotate(Quaternion(self.piv_norm, self.rad90))
-    rot_neg.rotate(Quaternion(self.piv_norm,-self.rad90))
-    rot_pos = rot_pos + self.cent
-    rot_neg = rot_neg + self.cent
-
-    hgt = (snap - self.cent).length
-    radius = None
-    if hgt != 0:
-        radius = (hgt / 2) + (self.wid**2) / (8 * hgt)
+    set_arch(self, arch)
+
+
+# Stores a solve_arch result as the current arch.
+def set_arch(self, arch):
+    arch_orig, arch_top, piv_norm, self.arch_pts, self.arch_offs = arch
+    self.arch_orig = Vector(arch_orig)
+    self.arch_top = Vector(arch_top)
+    self.piv_norm = Vector(piv_norm)
+    self.new_pts = Vector(self.arch_pts[0]), Vector(self.arch_pts[-1])
+
+
+# Builds the arch mesh from the solved preview arch, into the guide point
+# object when launched from OBJECT mode or into the edit mesh otherwise.
+# Arches finished in OBJECT mode share template meshes, arches extruded
+# with the mesh operators afterwards get their own.
+def build_arch_mesh(self, context, thick=0.0, depth=0.0):
+    if self.start_ed_type == 'OBJECT' and \
+            (self.direct_solid or not self.extr_enabled):
+        # finished arch, the guide object takes a shared template mesh
+        guide_me = self.snap.point.data
+        if template_arch_object(self.pts[0], self.pts[1], self.arch_top,
+                final_segm_cnt(self), self.profile, thick, depth,
+                self.snap.point) is not None:
+            bpy.data.meshes.remove(guide_me)
+        self.arch_verts = []
+        return
+    elif self.start_ed_type == 'OBJECT':
+        # arch goes into the guide point object's empty mesh
+        self.snap.move(self.curr_ed_type, self.arch_orig.copy())
+        run_op(bpy.ops.object.editmode_toggle)
+        self.curr_ed_type = context.mode
+        arch_ob = self.snap.point
+        inv_mw = arch_ob.matrix_world.inverted()
+        tag_arch_object(arch_ob, inv_mw * self.pts[0], inv_mw * self.pts[1],
+                inv_mw * self.arch_top)
     else:
-        radius = 0
-    cen_to_piv = radius - hgt
-    scale = cen_to_piv / (self.wid / 2)
-    circ_cen_p = self.cent.lerp(rot_pos, scale)
-    circ_cen_n = self.cent.lerp(rot_neg, scale)
-    align_p0 = self.pts[0] - circ_cen_p
-    align_p1 = self.pts[1] - circ_cen_p
-    self.ang_meas = align_p0.angle(align_p1, 0.0)
-    if self.ang_meas == 0.0:
-        self.bad_input = True
+        # add straight into the edit mesh the add-on started in
+        self.snap.remove(self.curr_ed_type)
+        arch_ob = bpy.context.edit_object
+    self.arch_verts = add_arch_to_edit_mesh(self, arch_ob, thick, depth)
+
+
+# Direct solid mode: sets self.thick (ARCH_EXTRUDE_1) or self.depth
+# (ARCH_EXTRUDE_2) from a typed value or from the mouse location.
+def update_solid_dims(self):
+    try:
+        val = float(self.num_str)
+    except ValueError:
+        val = None  # nothing or only part of a number typed yet
+    if val is not None:
+        if self.meas_mult != 0:
+            val /= self.meas_mult  # typed in display units
+        if self.stage == ARCH_EXTRUDE_1:
+            self.thick = max(0.0, val)
+        else:
+            self.depth = val
         return
+    ray_org = reg2d_to_org3d(self.reg, self.rv3d, self.mouse_loc)
+    ray_end = ray_org + reg2d_to_vec3d(self.reg, self.rv3d, self.mouse_loc)
+    if self.stage == ARCH_EXTRUDE_1:
+        hit = geometry.intersect_line_plane(ray_org, ray_end, self.arch_top,
+                self.piv_norm)
+        if hit is not None:
+            # measured along the offset of the middle sample, the same
+            # one the extrude measurement is drawn from
+            mid = len(self.arch_pts) // 2
+            offs = self.arch_offs[mid]
+            hit_offs = np.array(hit) - self.arch_pts[mid]
+            self.thick = max(0.0, hit_offs.dot(offs) / offs.dot(offs))
     else:
-        self.bad_input = False
-
-    if radius > self.wid/2 and hgt > radius:
-        self.ang_meas = 2 * pi - self.ang_meas
-
-    dist_sn_to_pos = (rot_pos - snap).length
-    dist_sn_to_neg = (rot_neg - snap).length
-
-    if dist_sn_to_pos > dist_sn_to_neg:  # closer to negative
-        self.new_pts = self.pts[1], self.pts[0]
-        self.circ_cen = circ_cen_p
-
-    else:  # dist_sn_to_pos < dist_sn_to_neg / closer to positive
-        self.new_pts = self.pts[0], self.pts[1]
-        self.circ_cen = circ_cen_n
+        base = self.arch_top
+        hits = geometry.intersect_line_line(ray_org, ray_end, base,
+                base + self.piv_norm)
+        if hits is not None:
+            self.depth = (hits[1] - base).dot(self.piv_norm)
 
 
 def click_handler(self, context):
@@ -906,8 +2500,6 @@ def click_handler(self, context):
             # move snap point to arch center before turning grab mode back on
             # as axis locks work from where an object was grabbed
             self.cent = self.pts[0].lerp(self.pts[1], 0.5)
-            self.mov_aligned = self.pts[0] - self.cent
-            self.wid = (self.pts[0] - self.pts[1]).length
 
             self.prev_co = self.cent.copy()
             self.snap.move(self.curr_ed_type, self.cent)
@@ -917,177 +2509,152 @@ def click_handler(self, context):
 
     elif self.stage == PLACE_3RD:
         # draw_arch
+        with profiler.timer("update_arch"):
+            update_arch(self, snap)
         if not self.bad_input:
-            update_gui(self)
+            if len(self.arch_pts) - 1 != final_segm_cnt(self):
+                # the preview was tessellated for the view or capped at
+                # PREVIEW_MAX_SEGM, the mesh gets the full count
+                set_arch(self, solve_arch(self.pts[0], self.pts[1], snap,
+                        final_segm_cnt(self), self.profile))
             add_pt(self, snap)
             self.stage += 1
 
-            self.snap.move(self.curr_ed_type, self.circ_cen.copy())
-            bpy.ops.object.editmode_toggle()
-            self.curr_ed_type = context.mode
-            inv_mw = self.snap.point.matrix_world.inverted()
-            piv_cent = inv_mw * self.circ_cen
-            bm = bmesh.from_edit_mesh(bpy.context.edit_object.data)
-            bm.verts.new(inv_mw * self.new_pts[0])
-            # Spin and deal with geometry on side 'a'
-            edges_start_a = bm.edges[:]
-            geom_start_a = bm.verts[:] + edges_start_a
-            ret = bmesh.ops.spin(
-                bm,
-                geom=geom_start_a,
-                angle=self.ang_meas,
-                steps=self.segm_cnt,
-                axis=self.piv_norm,
-                cent=piv_cent)
-            #edges_end_a = [ele for ele in ret["geom_last"]
-            #        if isinstance(ele, bmesh.types.BMEdge)]
-            del ret
+            if self.extr_enabled and self.direct_solid:
+                # solid is only built once thickness and depth are set
+                self.stage = ARCH_EXTRUDE_1
+                self.num_str = ''
+                update_solid_dims(self)
+                update_gui(self)
+                return
+            build_arch_mesh(self, context)
             if not self.extr_enabled:
                 self.stage = EXIT
             else:
-                bpy.context.scene.cursor_location = self.circ_cen
+                # resizing only offsets circular arches exactly, other
+                # profiles are scaled from their springing line middle
+                bpy.context.scene.cursor_location = self.arch_orig
                 bpy.context.tool_settings.snap_target = 'ACTIVE'
                 bpy.context.space_data.pivot_point = 'CURSOR'
                 bpy.context.space_data.transform_orientation = 'GLOBAL'
-                bpy.ops.mesh.select_all(action='SELECT')
-                bpy.ops.mesh.extrude_region_move()
-                bpy.ops.transform.resize('INVOKE_DEFAULT',
+                run_op(bpy.ops.mesh.extrude_region_move)
+                run_op(bpy.ops.transform.resize, 'INVOKE_DEFAULT',
                         constraint_orientation='GLOBAL')
 
                 self.stage = ARCH_EXTRUDE_1
+                update_gui(self)
         else:
             self.snap.grab(self.curr_ed_type)
 
+    elif self.stage == ARCH_EXTRUDE_1 and self.direct_solid:
+        self.stage = ARCH_EXTRUDE_2
+        self.num_str = ''
+        update_solid_dims(self)
+        update_gui(self)
+
+    elif self.stage == ARCH_EXTRUDE_2 and self.direct_solid:
+        build_arch_mesh(self, context, self.thick, self.depth)
+        self.stage = EXIT
+
     elif self.stage == ARCH_EXTRUDE_1:
         bpy.context.tool_settings.mesh_select_mode = False, False, True
         #bpy.context.space_data.transform_orientation = 'LOCAL'
         bpy.context.tool_settings.snap_target = 'CLOSEST'
         bpy.context.space_data.pivot_point = 'MEDIAN_POINT'
-        update_gui(self)
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.view3d.edit_mesh_extrude_move_normal('INVOKE_DEFAULT')
+        # select only the arch faces made by the first extrude
+        for f in linked_faces(self.arch_verts):
+            f.select_set(True)
+        editmode_refresh(self.curr_ed_type)
+        run_op(bpy.ops.view3d.edit_mesh_extrude_move_normal, 'INVOKE_DEFAULT')
         self.stage = ARCH_EXTRUDE_2
+        update_gui(self)
 
     elif self.stage == ARCH_EXTRUDE_2:
         self.stage = EXIT
 
 
-# To-Do : make something nicer than this for handling GUI changes...
-def update_gui(self):
+# HUD screen texts: (instruction, top bar, bottom bar left, bottom bar right)
+# keyed on (stage group, paused), see gui_key
+HUD_SCREENS = {
+    (PLACE_1ST, False): (
+        "place 3 points to create arch",
+        "LMB - place point, CTRL - snap point, "
+        "XYZ - add axis lock, C - clear axis lock",
+        "SPACE - pause to navigate / change settings",
+        "ESC, RMB - quit"),
+    (ARCH_EXTRUDE_1, False): (
+        "set arch width / thickness",
+        "LMB - confirm width",
+        "",
+        "ESC, RMB - quit"),
+    (ARCH_EXTRUDE_2, False): (
+        "set arch length",
+        "LMB - confirm length, CTRL - snap point",
+        "",
+        "ESC, RMB - quit"),
+    (PLACE_1ST, True): (
+        "paused, navigate or change settings",
+        "UP / MSWH_UP - more segments, DOWN / MSWH_DOWN - fewer, "
+        "SHIFT - double / halve, 0-9 - type count",
+        "SPACE - resume point placement, R - reset point placement",
+        "ESC, RMB - quit"),
+    (ARCH_EXTRUDE_1, True): (
+        "paused, navigate to better position",
+        "",
+        "SPACE - resume extrude",
+        "ESC, RMB - quit"),
+}
+
+
+# direct solid mode replacements for HUD_SCREENS
+HUD_SCREENS_DIRECT = {
+    (ARCH_EXTRUDE_1, False): (
+        "set arch thickness",
+        "LMB - confirm thickness, type a number for exact thickness",
+        "SPACE - pause to navigate",
+        "ESC, RMB - quit"),
+    (ARCH_EXTRUDE_2, False): (
+        "set arch depth",
+        "LMB - confirm depth, type a number for exact depth",
+        "SPACE - pause to navigate",
+        "ESC, RMB - quit"),
+    (ARCH_EXTRUDE_1, True): (
+        "paused, navigate to better position",
+        "",
+        "SPACE - resume",
+        "ESC, RMB - quit"),
+}
+
+
+def gui_key(stage, paused):
+    if stage < ARCH_EXTRUDE_1:
+        return PLACE_1ST, paused
+    elif paused:
+        return ARCH_EXTRUDE_1, True
+    else:
+        return min(stage, ARCH_EXTRUDE_2), False
+
+
+# builds every HUD screen once, called from invoke
+def build_gui(helpdisp, direct_solid=False):
     title_txt_sz = 24
     bar_txt_sz = 12
     #bar_txt_sz = 18  # tablet
-    self.helpdisp.clear_str()
-    if not self.paused:
-        if self.stage < ARCH_EXTRUDE_1:
-            self.helpdisp.add_str(
-                "INS",
-                "place 3 points to create arch",
-                title_txt_sz,
-                'C')
-            self.helpdisp.add_str(
-                "TOP",
-                "LMB - place point, CTRL - snap point, "
-                "XYZ - add axis lock, C - clear axis lock",
-                bar_txt_sz,
-                'L')
-            self.helpdisp.add_str(
-                "BOT",
-                "SPACE - pause to navigate / change settings",
-                bar_txt_sz,
-                'L')
-            self.helpdisp.add_str(
-                "BOT",
-                "ESC, RMB - quit",
-                bar_txt_sz,
-                'R')
-        elif self.stage == ARCH_EXTRUDE_1:
-            self.helpdisp.add_str(
-                "INS",
-                "set arch width / thickness",
-                title_txt_sz,
-                'C')
-            self.helpdisp.add_str(
-                "TOP",
-                "LMB - confirm width",
-                bar_txt_sz,
-                'L')
-            self.helpdisp.add_str(
-                "BOT",
-                "",
-                bar_txt_sz,
-                'L')
-            self.helpdisp.add_str(
-                "BOT",
-                "ESC, RMB - quit",
-                bar_txt_sz,
-                'R')
-        else:
-            self.helpdisp.add_str(
-                "INS",
-                "set arch length",
-                title_txt_sz,
-                'C')
-            self.helpdisp.add_str(
-                "TOP",
-                "LMB - confirm length, CTRL - snap point",
-                bar_txt_sz,
-                'L')
-            self.helpdisp.add_str(
-                "BOT",
-                "",
-                bar_txt_sz,
-                'L')
-            self.helpdisp.add_str(
-                "BOT",
-                "ESC, RMB - quit",
-                bar_txt_sz,
-                'R')
-    else:
-        if self.stage < ARCH_EXTRUDE_1:
-            self.helpdisp.add_str(
-                "INS",
-                "paused, navigate or change settings",
-                title_txt_sz,
-                'C')
-            self.helpdisp.add_str(
-                "TOP",
-                "UP / MSWH_UP - increase segments, "
-                "DOWN / MSWH_DOWN - decrease segments",
-                bar_txt_sz,
-                'L')
-            self.helpdisp.add_str(
-                "BOT",
-                "SPACE - resume point placement, R - reset point placement",
-                bar_txt_sz,
-                'L')
-            self.helpdisp.add_str(
-                "BOT",
-                "ESC, RMB - quit",
-                bar_txt_sz,
-                'R')
-        else:
-            self.helpdisp.add_str(
-                "INS",
-                "paused, navigate to better position",
-                title_txt_sz,
-                'C')
-            self.helpdisp.add_str(
-                "TOP",
-                "",
-                bar_txt_sz,
-                'L')
-            self.helpdisp.add_str(
-                "BOT",
-                "SPACE - resume extrude",
-                bar_txt_sz,
-                'L')
-            self.helpdisp.add_str(
-                "BOT",
-                "ESC, RMB - quit",
-                bar_txt_sz,
-                'R')
-    self.helpdisp.update()
+    screens = dict(HUD_SCREENS)
+    if direct_solid:
+        screens.update(HUD_SCREENS_DIRECT)
+    for key, (ins, top, bot_l, bot_r) in screens.items():
+        helpdisp.new_screen(key)
+        helpdisp.add_str("INS", ins, title_txt_sz, 'C')
+        helpdisp.add_str("TOP", top, bar_txt_sz, 'L')
+        helpdisp.add_str("BOT", bot_l, bar_txt_sz, 'L')
+        helpdisp.add_str("BOT", bot_r, bar_txt_sz, 'R')
+
+
+# switches to the prebuilt screen for the current stage and pause state
+def update_gui(self):
+    with profiler.timer("update_gui"):
+        self.helpdisp.set_screen(gui_key(self.stage, self.paused))
 
 
 def retreive_settings(arg):
@@ -1205,97 +2772,219 @@ def retreive_settings(arg):
     return settings_dict
 
 
-def draw_callback_px(self, context):
-    reg = bpy.context.region
-    rv3d = bpy.context.region_data
-    snap = self.snap.get_co(self.curr_ed_type)
+# Finds the crown vertex of the arch edges and its copy made by the
+# current extrude stage by walking the edges linked to the crown, so it
+# does not depend on where the arch sits in the mesh's vertex order.
+def find_extr_meas_verts(self):
+    if len(self.arch_verts) != len(self.arch_pts):
+        return None
+    arch_set = set(self.arch_verts)
+    v1 = self.arch_verts[len(self.arch_verts) // 2]
+    prev_copy = None
+    if self.stage == ARCH_EXTRUDE_2 and self.meas_verts is not None:
+        prev_copy = self.meas_verts[1]  # extrados copy from 1st extrude
+    for e in v1.link_edges:
+        v_oth = e.other_vert(v1)
+        if v_oth not in arch_set and v_oth != prev_copy:
+            return v1, v_oth
+    return None
+
+
+# Returns world space locations of the arch crown vertex and its copy
+# made by the current extrude stage, used for the extrude measurements.
+# The operator based stages keep the vertex handles between frames and
+# only look them up again after a stage change or when the mesh was
+# rebuilt (e.g. by undo).
+def get_extr_meas_pts(self):
+    if self.direct_solid:
+        if self.stage == ARCH_EXTRUDE_1:
+            mid = len(self.arch_pts) // 2
+            v1 = Vector(self.arch_pts[mid])
+            return v1, v1 + Vector(self.arch_offs[mid]) * self.thick
+        v1 = self.arch_top
+        return v1, v1 + self.piv_norm * self.depth
+    meas_verts = self.meas_verts
+    if self.meas_verts_stage != self.stage or meas_verts is None or \
+            not (meas_verts[0].is_valid and meas_verts[1].is_valid):
+        if not all(v.is_valid for v in self.arch_verts):
+            bm = bmesh.from_edit_mesh(bpy.context.edit_object.data)
+            self.arch_verts = relink_arch_verts(self, bm)
+        meas_verts = find_extr_meas_verts(self)
+        self.meas_verts = meas_verts
+        self.meas_verts_stage = self.stage
+        if meas_verts is None:
+            return self.arch_top, self.arch_top
+    m_w = bpy.context.edit_object.matrix_world
+    return m_w * meas_verts[0].co, m_w * meas_verts[1].co
+
+
+# Looks the arch verts up again by location after the edit mesh was
+# rebuilt and the old handles became invalid.
+def relink_arch_verts(self, bm):
+    inv_mw = bpy.context.edit_object.matrix_world.inverted()
+    arch_cos = [(inv_mw * Vector(co)).to_tuple(5) for co in self.arch_pts]
+    by_co = {v.co.to_tuple(5): v for v in bm.verts}
+    return [by_co[co] for co in arch_cos if co in by_co]
+
+
+# Thins a dense arch polyline (and its offsets) to at most
+# PREVIEW_MAX_SEGM segments for drawing. Both ends and the middle sample,
+# the crown of pointed profiles, are always kept.
+def decimate_arch(arch_pts, arch_offs=None):
+    pt_cnt = len(arch_pts)
+    if pt_cnt - 1 <= PREVIEW_MAX_SEGM:
+        return arch_pts, arch_offs
+    idx = np.rint(np.linspace(0, pt_cnt - 1, PREVIEW_MAX_SEGM + 1))
+    idx = np.union1d(idx.astype(int), [pt_cnt // 2])
+    if arch_offs is None:
+        return arch_pts[idx], None
+    return arch_pts[idx], arch_offs[idx]
+
+
+# Direct solid mode preview, draws the outline of the solid that will be
+# built from the current thickness and depth.
+def draw_solid_preview(self, dl):
+    depth = self.depth if self.stage == ARCH_EXTRUDE_2 else 0.0
+    arch_pts, arch_offs = decimate_arch(self.arch_pts, self.arch_offs)
+    verts = arch_solid_data(arch_pts, arch_offs,
+            np.array(self.piv_norm), self.thick, depth)[0]
+    pt_cnt = len(arch_pts)
+    rings = verts.reshape(-1, pt_cnt, 3)
+    outlines = list(rings)
+    if len(rings) > 1:
+        # springing end outlines, ring order is intrados, extrados, then
+        # their depth copies
+        cap_order = [0, 1, 3, 2, 0] if len(rings) == 4 else [0, 1]
+        outlines.append(rings[cap_order, 0])
+        outlines.append(rings[cap_order, -1])
+    for outline in outlines:
+        for strip in self.proj.project_polyline(outline):
+            dl.add_line_strip(strip.tolist(), Colr.green)
+
+
+# Records the 3D View overlay for the current stage into dl.
+def build_overlay(self, dl, snap, extr_pts):
+    proj = self.proj
     pts2d = []
     line_pts = []
 
     if self.stage == PLACE_1ST:
-        guide2d = loc3d_to_reg2d(reg, rv3d, snap)
+        guide2d = proj.project_list((snap,))[0]
 
     elif self.stage == PLACE_2ND:
-        guide2d = loc3d_to_reg2d(reg, rv3d, snap)
-        pts2d = [loc3d_to_reg2d(reg, rv3d, i) for i in self.pts]
+        guide2d = proj.project_list((snap,))[0]
+        pts2d = proj.project_static(self.pts)
         line_pts = self.pts[0], snap
-        if not len(pts2d) > 0:
-            print("len(pts2d) == 0")
 
     elif self.stage == PLACE_3RD:
-        guide2d = loc3d_to_reg2d(reg, rv3d, snap)
-        pts2d = [loc3d_to_reg2d(reg, rv3d, i) for i in self.pts]
+        guide2d = proj.project_list((snap,))[0]
+        pts2d = proj.project_static(self.pts)
 
         # attempt to draw arch
-        update_arch(self, snap)
-        if not self.bad_input and self.circ_cen is not None:
-            arch_top = get_rotated_pt(self.circ_cen, self.new_pts[0],
-                    self.ang_meas/2, self.piv_norm)
-            line_pts = self.cent, arch_top
-
-            draw_circ_arch_3D(self.segm_cnt, self.new_pts, self.circ_cen,
-                    self.ang_meas, self.piv_norm, Colr.green, reg, rv3d)
+        if not self.bad_input and self.arch_orig is not None:
+            line_pts = self.cent, self.arch_top
+
+            draw_circ_arch_3D(dl, decimate_arch(self.arch_pts)[0],
+                    self.arch_orig, Colr.green, proj)
         else:
             if len(pts2d) > 1:
-                draw_line_2D(pts2d[0], pts2d[1], Colr.white)
+                draw_line_2D(dl, pts2d[0], pts2d[1], Colr.white)
 
-    elif self.stage == ARCH_EXTRUDE_1:
-        bm = bmesh.from_edit_mesh(bpy.context.edit_object.data)
-        if hasattr(bm.verts, "ensure_lookup_table"):
-            bm.verts.ensure_lookup_table()
-        vts = bm.verts
-        vert_cnt = self.segm_cnt + 1
-        v_cent1_idx = vert_cnt // 2
-        v_cent2_idx = v_cent1_idx + vert_cnt
-        m_w = bpy.context.edit_object.matrix_world
-        v1 = m_w * vts[v_cent1_idx].co
-        v2 = m_w * vts[v_cent2_idx].co
-        line_pts = v1, v2
+    if self.stage >= ARCH_EXTRUDE_1 and self.direct_solid:
+        draw_solid_preview(self, dl)
 
-        pts_cust = self.pts[0], self.pts[1], v1
-        pts2d = [loc3d_to_reg2d(reg, rv3d, i) for i in pts_cust]
-        guide2d = loc3d_to_reg2d(reg, rv3d, v2)
+    if self.stage == ARCH_EXTRUDE_1:
+        v1, v2 = extr_pts
+        line_pts = v1, v2
+        pts2d = proj.project_static(self.pts[:2]) + proj.project_list((v1,))
+        guide2d = proj.project_list((v2,))[0]
 
     elif self.stage == ARCH_EXTRUDE_2:
-        bm = bmesh.from_edit_mesh(bpy.context.edit_object.data)
-        if hasattr(bm.verts, "ensure_lookup_table"):
-            bm.verts.ensure_lookup_table()
-        vts = bm.verts
-        vert_cnt = self.segm_cnt + 1
-        v_cent1_idx = vert_cnt // 2
-        v_cent2_idx = v_cent1_idx + (vert_cnt * 2)
-        m_w = bpy.context.edit_object.matrix_world
-        v1 = m_w * vts[v_cent1_idx].co
-        v2 = m_w * vts[v_cent2_idx].co
+        v1, v2 = extr_pts
         line_pts = v1, v2
-        pts2d = [loc3d_to_reg2d(reg, rv3d, v1)]
-        guide2d = loc3d_to_reg2d(reg, rv3d, v2)
+        pts2d, guide2d = proj.project_list((v1, v2))
+        pts2d = [pts2d]
 
     if line_pts != []:
-        self.mean_dist.draw(line_pts, self.meas_mult, self.meas_suff)
+        self.mean_dist.draw(dl, line_pts, self.meas_mult, self.meas_suff)
     for i in pts2d:
-        draw_pt_2D(i, Colr.white)
-    draw_pt_2D(guide2d, Colr.green)
+        draw_pt_2D(dl, i, Colr.white)
+    draw_pt_2D(dl, guide2d, Colr.green)
 
     # display number of segments
     if self.paused and self.stage < ARCH_EXTRUDE_1:
         if guide2d is not None:
-            self.segm_cntr.draw(self.segm_cnt, guide2d)
-            #self.segm_cntr.draw(self.segm_cnt, self.mouse_loc)
+            self.segm_cntr.draw(dl, self.segm_cnt, guide2d)
+            #self.segm_cntr.draw(dl, self.segm_cnt, self.mouse_loc)
 
-    self.helpdisp.draw()
+
+def draw_callback_px(self, context):
+    with profiler.timer("draw_callback_px") as frame:
+        draw_frame(self)
+    if profiler.enabled:
+        profiler.add_frame(frame.secs)
+        if self.prof_overlay:
+            draw_profiling(self.draw_backend, self.reg)
+
+
+def draw_frame(self):
+    self.proj.set_view()
+    snap = self.snap.get_co(self.curr_ed_type)
+    extr_pts = None
+    if self.stage == PLACE_3RD:
+        with profiler.timer("update_arch"):
+            update_arch(self, snap)
+        watch = snap.to_tuple(), self.arch_key
+    elif self.stage >= ARCH_EXTRUDE_1:
+        extr_pts = get_extr_meas_pts(self)
+        watch = tuple(v.to_tuple() for v in extr_pts)
+    else:
+        watch = snap.to_tuple()
+
+    # only rebuild the overlay when something it shows has changed
+    overlay_key = (self.proj.view_key, self.stage, self.paused,
+            self.segm_cnt, len(self.pts), watch)
+    if overlay_key != self.overlay_key:
+        self.overlay_key = overlay_key
+        self.overlay.clear()
+        build_overlay(self, self.overlay, snap, extr_pts)
+    self.overlay.flush(self.draw_backend)
+
+    self.helpdisp.draw(self.draw_backend)
 
 
 # To-Do : move to DrawSegmCounter?
-def segm_decrm(self):
-    if self.segm_cnt > 2:
-        self.segm_cnt -= 1
+# Steps of one, or doubling / halving with large for dense arches.
+def segm_incrm(self, large=False):
+    self.segm_str = ''
+    segm_cnt = self.segm_cnt * 2 if large else self.segm_cnt + 1
+    self.segm_cnt = min(segm_cnt, SEGM_CNT_LIMIT)
+
+
+def segm_decrm(self, large=False):
+    self.segm_str = ''
+    segm_cnt = self.segm_cnt // 2 if large else self.segm_cnt - 1
+    self.segm_cnt = max(segm_cnt, 2)
+
+
+# Typed segment count, digits add to self.segm_str and BACK_SPACE removes
+# the last one. Counts below 2 show as 2 until more digits are typed.
+def segm_type(self, event_type):
+    if event_type == 'BACK_SPACE':
+        self.segm_str = self.segm_str[:-1]
+    else:
+        segm_str = (self.segm_str + NUM_KEYS[event_type]).lstrip('0')
+        if int(segm_str or 0) <= SEGM_CNT_LIMIT:
+            self.segm_str = segm_str
+    if self.segm_str:
+        self.segm_cnt = max(int(self.segm_str), 2)
 
 
 class TPARCH_OT_modal(bpy.types.Operator):
     '''Launch the arch tool'''
     bl_idname = "view3d.modal_arch_tool"
     bl_label = "Three Point Arch Tool"
+    bl_options = {'UNDO'}
 
     # Only launch Add-On from OBJECT or EDIT modes
     @classmethod
@@ -1303,18 +2992,62 @@ class TPARCH_OT_modal(bpy.types.Operator):
         return context.mode == 'OBJECT' or context.mode == 'EDIT_MESH'
 
     def modal(self, context, event):
-        context.area.tag_redraw()
+        try:
+            return self.handle_event(context, event)
+        except Exception:
+            # don't leave undo off, handlers, the timer or the guide
+            # behind after a failed event
+            bpy.types.SpaceView3D.draw_handler_remove(self._handle, 'WINDOW')
+            end_session(self, True)
+            raise
+
+    def handle_event(self, context, event):
         self.curr_ed_type = context.mode
 
+        if event.type == 'TIMER' and self.redraw_timer is not None:
+            redraw_timer_done(self, context)
+            redraw_if_dirty(self, context)
+            return {'RUNNING_MODAL'}
+
         if event.type in {'MIDDLEMOUSE', 'NUMPAD_1', 'NUMPAD_2', 'NUMPAD_3',
         'NUMPAD_4', 'NUMPAD_6', 'NUMPAD_7', 'NUMPAD_8', 'NUMPAD_9', 'NUMPAD_5'}:
             return {'PASS_THROUGH'}
 
         if event.type == 'MOUSEMOVE':
             self.mouse_loc = Vector((event.mouse_region_x, event.mouse_region_y))
+            if self.direct_solid and self.stage in {ARCH_EXTRUDE_1,
+                    ARCH_EXTRUDE_2} and not self.paused:
+                update_solid_dims(self)
+
+        if self.snap.follow and self.stage < ARCH_EXTRUDE_1 and \
+                not self.paused:
+            if event.type in {'MOUSEMOVE', 'LEFT_CTRL', 'RIGHT_CTRL'}:
+                follow_mouse(self, event.ctrl)
+            elif event.type in AXIS_KEYS and event.value == 'PRESS':
+                self.axis_lock = AXIS_KEYS[event.type]
+                follow_mouse(self, event.ctrl)
+            elif event.type == 'C' and event.value == 'PRESS':
+                self.axis_lock = None
+                follow_mouse(self, event.ctrl)
+
+        if self.direct_solid and self.stage in {ARCH_EXTRUDE_1,
+                ARCH_EXTRUDE_2} and not self.paused and event.value == 'PRESS':
+            if event.type in NUM_KEYS:
+                num_str = self.num_str + NUM_KEYS[event.type]
+                if num_str.count('.') < 2 and '-' not in num_str[1:]:
+                    self.num_str = num_str
+                update_solid_dims(self)
+            elif event.type == 'BACK_SPACE':
+                self.num_str = self.num_str[:-1]
+                update_solid_dims(self)
 
         if event.type in {'RET', 'LEFTMOUSE'} and event.value == 'RELEASE':
-            click_handler(self, context)
+            prev_stage = self.stage
+            with profiler.timer("click_handler") as click:
+                click_handler(self, context)
+            if profiler.enabled and self.stage != prev_stage:
+                profiler.add_time("stage %s > %s" % (STAGE_NAMES[prev_stage],
+                        STAGE_NAMES[self.stage]), click.secs)
 
         if event.type == 'SPACE' and event.value == 'RELEASE':
             if not self.paused:
@@ -1322,14 +3055,17 @@ class TPARCH_OT_modal(bpy.types.Operator):
                 update_gui(self)
             else:
                 self.paused = False
+                self.segm_str = ''
                 update_gui(self)
                 if self.stage < ARCH_EXTRUDE_1:
                     self.snap.grab(self.curr_ed_type)
+                elif self.direct_solid:
+                    update_solid_dims(self)
                 elif self.stage == ARCH_EXTRUDE_1:
-                    bpy.ops.transform.resize('INVOKE_DEFAULT',
+                    run_op(bpy.ops.transform.resize, 'INVOKE_DEFAULT',
                             constraint_orientation = 'GLOBAL')
                 else:
-                    bpy.ops.transform.translate('INVOKE_DEFAULT',
+                    run_op(bpy.ops.transform.translate, 'INVOKE_DEFAULT',
                             constraint_axis=(False, False, True),
                             constraint_orientation='NORMAL',
                             release_confirm=True)
@@ -1337,19 +3073,24 @@ class TPARCH_OT_modal(bpy.types.Operator):
         if self.paused:
             if self.stage < ARCH_EXTRUDE_1:
                 if event.type == 'WHEELUPMOUSE':
-                    self.segm_cnt += 1
+                    segm_incrm(self, event.shift)
 
                 if event.type == 'WHEELDOWNMOUSE':
-                    segm_decrm(self)
+                    segm_decrm(self, event.shift)
 
                 if event.type == 'UP_ARROW' and event.value == 'RELEASE':
-                    self.segm_cnt += 1
+                    segm_incrm(self, event.shift)
 
                 if event.type == 'DOWN_ARROW' and event.value == 'RELEASE':
-                    segm_decrm(self)
+                    segm_decrm(self, event.shift)
+
+                if event.value == 'PRESS' and (event.type == 'BACK_SPACE' or
+                        NUM_KEYS.get(event.type, '.').isdigit()):
+                    segm_type(self, event.type)
 
             if event.type == 'R' and event.value == 'RELEASE':
                 self.paused = False
+                self.segm_str = ''
                 update_gui(self)
                 if self.prev_co is not None:
                     last2d = loc3d_to_reg2d(self.reg, self.rv3d, self.prev_co)
@@ -1380,11 +3121,14 @@ class TPARCH_OT_modal(bpy.types.Operator):
             if self.curr_ed_type == 'EDIT_MESH':
                 # recalc normals outside just in case they were inverted
                 bm = bmesh.from_edit_mesh(bpy.context.edit_object.data)
-                bmesh.ops.recalc_face_normals(bm, faces=bm.faces)
+                bmesh.ops.recalc_face_normals(bm,
+                        faces=linked_faces(self.arch_verts))
+                editmode_refresh(self.curr_ed_type)
             bpy.types.SpaceView3D.draw_handler_remove(self._handle, 'WINDOW')
             exit_addon(self)
             return {'FINISHED'}
 
+        redraw_if_dirty(self, context)
         return {'RUNNING_MODAL'}
 
     def invoke(self, context, event):
@@ -1396,24 +3140,39 @@ class TPARCH_OT_modal(bpy.types.Operator):
             self._handle = bpy.types.SpaceView3D.draw_handler_add(draw_callback_px,
                     args, 'WINDOW', 'POST_PIXEL')
 
+            # arches started in EDIT_MESH mode are added to the edit mesh
             if context.mode == 'EDIT_MESH':
-                bpy.ops.object.editmode_toggle()
-            bpy.ops.object.select_all(action='DESELECT')
+                self.sel_backup = EditSelection(context.edit_object)
+                run_op(bpy.ops.mesh.select_all, action='DESELECT')
+            else:
+                run_op(bpy.ops.object.select_all, action='DESELECT')
 
             addon_prefs = context.user_preferences.addons[__name__].preferences
             #sett_dict = retreive_settings(addon_prefs.np_col_scheme)
             sett_dict = retreive_settings("def_blender_gray")
 
             self.helpdisp = HelpDisplay(context.region, sett_dict)
-            self.mean_dist = DrawMeanDistance(18, sett_dict)
+            self.proj = ViewProjector()
+            self.draw_backend = BglBackend()
+            self.overlay = DrawList()
+            self.overlay_key = None  # inputs overlay was last built for
+            self.mean_dist = DrawMeanDistance(18, sett_dict, self.proj)
             self.segm_cntr = DrawSegmCounter(sett_dict)
             self.curr_ed_type = context.mode  # current Blender Editor Type
+            self.start_ed_type = context.mode
             self.stage = PLACE_1ST
             self.mouse_loc = Vector((event.mouse_region_x, event.mouse_region_y))
             self.reg = bpy.context.region
             self.rv3d = bpy.context.region_data
             self.piv_norm = None
             self.segm_cnt = addon_prefs.segm_cnt  # move to DrawSegmCounter?
+            self.segm_str = ''  # typed segment count
+            self.profile = addon_prefs.profile
+            self.segm_mode = addon_prefs.segm_mode
+            self.chord_tol = addon_prefs.chord_tol
+            self.edge_len = addon_prefs.edge_len
+            self.tess_key = None  # inputs tess_stats was measured for
+            self.tess_stats = None
             self.meas_mult = addon_prefs.np_scale_dist
             self.meas_suff = ''
             self.pt_cnt = 0
@@ -1421,19 +3180,50 @@ class TPARCH_OT_modal(bpy.types.Operator):
             self.new_pts = None
             self.prev_co = None  # previous coordinate
             self.cent = None
-            self.ang_meas = None
-            self.circ_cen = None
-            self.wid = None
-            self.rad90 = radians(90)
-            self.mov_aligned = None
-            self.snap = SnapPoint()
+            self.arch_orig = None  # profile reference point, circle centre
+            self.arch_pts = None
+            self.arch_offs = None  # arch_pts offset directions
+            self.arch_top = None
+            self.arch_key = None  # inputs arch_pts was last solved for
+            self.snap = SnapPoint(context.mode, addon_prefs.fast_snap)
+            self.snap_index = None
+            self.axis_lock = None  # fast snapping axis lock
+            if addon_prefs.fast_snap:
+                # index is built before the guide point is created so the
+                # guide point itself is never a snapping candidate
+                static = ()
+                if context.mode == 'EDIT_MESH':
+                    static = (context.edit_object.name,)
+                self.snap_index = SnapIndex(context.scene, static)
+                bpy.app.handlers.scene_update_post.append(
+                        self.snap_index.mark_updated)
+                if addon_prefs.surface_snap and BVHTree is not None:
+                    self.snap.surface = SurfaceIndex(context.scene, static)
+                    bpy.app.handlers.scene_update_post.append(
+                            self.snap.surface.mark_updated)
+            self.arch_verts = []  # arch verts added to the edit mesh
+            self.meas_verts = None  # extrude measurement vert handles
+            self.meas_verts_stage = None  # stage meas_verts were found for
             self.settings_backup = backup_blender_settings()
-            self.sel_backup = None  # place holder
+            if context.mode != 'EDIT_MESH':
+                self.sel_backup = None
             self.bad_input = False
             self.extr_enabled = addon_prefs.extr_enabled
+            self.direct_solid = addon_prefs.direct_solid
+            profiler.reset(addon_prefs.profiling)
+            self.prof_overlay = addon_prefs.profiling_overlay
+            self.prof_path = addon_prefs.profiling_path
+            self.thick = 0.0  # direct solid thickness
+            self.depth = 0.0  # direct solid depth
+            self.num_str = ''  # typed thickness / depth
             #self.debug_flag = False
             self.paused = False
             self.force_quit = False
+            self.redraw_key = None  # overlay state at last redraw request
+            self.redraw_pending = False
+            self.redraw_interval = 1 / 60
+            self.last_redraw = 0.0
+            self.redraw_timer = None
 
             tmp_suff = addon_prefs.np_suffix_dist
             if tmp_suff != 'None':
@@ -1442,8 +3232,13 @@ class TPARCH_OT_modal(bpy.types.Operator):
             context.window_manager.modal_handler_add(self)
 
             init_blender_settings()
+            build_gui(self.helpdisp, self.direct_solid)
             update_gui(self)
             self.snap.create(self.mouse_loc, self.curr_ed_type)
+            if self.snap.point is not None:
+                for index in (self.snap_index, self.snap.surface):
+                    if index is not None:
+                        index.skip.add(self.snap.point.name)
             #print("Add-on started!")  # debug
 
             return {'RUNNING_MODAL'}
@@ -1452,6 +3247,169 @@ class TPARCH_OT_modal(bpy.types.Operator):
             return {'CANCELLED'}
 
 
+class TPARCH_OT_add(bpy.types.Operator):
+    '''Add an arch through three points'''
+    bl_idname = "mesh.arch_add"
+    bl_label = "Add Arch"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    p1 = FloatVectorProperty(name="Point 1", subtype='XYZ',
+        default=(-1.0, 0.0, 0.0))
+    p2 = FloatVectorProperty(name="Point 2", subtype='XYZ',
+        default=(1.0, 0.0, 0.0))
+    p3 = FloatVectorProperty(name="Point 3", subtype='XYZ',
+        default=(0.0, 0.0, 1.0))
+    segm_cnt = IntProperty(name="Arch segments", min=2,
+            max=SEGM_CNT_LIMIT, default=16)
+    segm_mode = EnumProperty(name="Segments", items=SEGM_MODE_ITEMS,
+        default='COUNT')
+    chord_tol = FloatProperty(name="Chord tolerance", min=0.00001,
+        default=0.001, subtype='DISTANCE')
+    edge_len = FloatProperty(name="Edge length", min=0.0001, default=0.1,
+        subtype='DISTANCE')
+    profile = EnumProperty(name="Profile", items=PROFILE_ITEMS,
+        default='CIRCULAR')
+    thick = FloatProperty(name="Thickness", min=0.0, default=0.0,
+        subtype='DISTANCE')
+    depth = FloatProperty(name="Depth", min=0.0, default=0.0,
+        subtype='DISTANCE')
+
+    @classmethod
+    def poll(self, context):
+        return context.mode == 'OBJECT'
+
+    def execute(self, context):
+        segm_cnt = self.segm_cnt
+        if self.segm_mode != 'COUNT':
+            stats = arch_tess_stats(self.p1, self.p2, self.p3, self.profile)
+            if stats is not None:
+                segm_cnt = tess_segm_cnt(stats, self.segm_mode,
+                        self.chord_tol, self.edge_len)
+        # object origin goes at the profile reference point (the circle
+        # centre for circular arches), same as the modal tool
+        ob = template_arch_object(self.p1, self.p2, self.p3, segm_cnt,
+                self.profile, self.thick, self.depth)
+        if ob is None:
+            self.report({'WARNING'}, "Points cannot form an arch")
+            return {'CANCELLED'}
+
+        for o in context.selected_objects:
+            o.select = False
+        ob.select = True
+        context.scene.objects.active = ob
+        return {'FINISHED'}
+
+
+class TPARCH_arch_row(bpy.types.PropertyGroup):
+    p1 = FloatVectorProperty(name="Point 1", subtype='XYZ')
+    p2 = FloatVectorProperty(name="Point 2", subtype='XYZ')
+    p3 = FloatVectorProperty(name="Point 3", subtype='XYZ')
+    segm_cnt = IntProperty(name="Arch segments", min=2,
+            max=SEGM_CNT_LIMIT, default=16)
+    profile = EnumProperty(name="Profile", items=PROFILE_ITEMS,
+        default='CIRCULAR')
+    thick = FloatProperty(name="Thickness", min=0.0, default=0.0,
+        subtype='DISTANCE')
+    depth = FloatProperty(name="Depth", min=0.0, default=0.0,
+        subtype='DISTANCE')
+
+
+class TPARCH_OT_batch(bpy.types.Operator):
+    '''Create many arches from point triples as a single mesh'''
+    bl_idname = "mesh.arch_batch"
+    bl_label = "Batch Arches"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    arches = CollectionProperty(type=TPARCH_arch_row)
+
+    @classmethod
+    def poll(self, context):
+        return context.mode == 'OBJECT'
+
+    def execute(self, context):
+        if len(self.arches) == 0:
+            self.report({'WARNING'}, "No arches given, nothing to create")
+            return {'CANCELLED'}
+        pts = [(r.p1[:], r.p2[:], r.p3[:]) for r in self.arches]
+        segm_cnts = [r.segm_cnt for r in self.arches]
+        thick = [r.thick for r in self.arches]
+        depth = [r.depth for r in self.arches]
+        profiles = [r.profile for r in self.arches]
+        ob, valid = create_arches(pts, segm_cnts, thick, depth,
+                profiles=profiles)
+
+        for o in context.selected_objects:
+            o.select = False
+        ob.select = True
+        context.scene.objects.active = ob
+        bad_cnt = len(valid) - int(valid.sum())
+        if bad_cnt > 0:
+            self.report({'WARNING'},
+                    "Skipped %d arches with bad input" % bad_cnt)
+        return {'FINISHED'}
+
+
+class TPARCH_OT_arcade(bpy.types.Operator):
+    '''Repeat the active arch as linked duplicates along its span or a path'''
+    bl_idname = "object.arch_arcade"
+    bl_label = "Arch Arcade"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    count = IntProperty(name="Bays", min=2, default=5)
+    pitch = FloatProperty(name="Pitch",
+        description="Distance between bays, 0 uses the arch span",
+        min=0.0, default=0.0, subtype='DISTANCE')
+    path = StringProperty(name="Path",
+        description="Curve or mesh object to spread the bays along")
+
+    @classmethod
+    def poll(self, context):
+        ob = context.active_object
+        return context.mode == 'OBJECT' and ob is not None and \
+                ob.type == 'MESH'
+
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(self, "count")
+        layout.prop(self, "pitch")
+        layout.prop_search(self, "path", context.scene, "objects")
+
+    def execute(self, context):
+        ob = context.active_object
+        path_pts = None
+        if self.path:
+            path_ob = context.scene.objects.get(self.path)
+            if path_ob is None or path_ob == ob or \
+                    path_ob.type not in {'CURVE', 'MESH'}:
+                self.report({'WARNING'}, "Path must be another curve or "
+                        "mesh object")
+                return {'CANCELLED'}
+            path_pts = get_path_pts(context.scene, path_ob)
+        mats = arcade_matrices(ob.matrix_world, *get_arch_frame(ob),
+                cnt=self.count, pitch=self.pitch, path_pts=path_pts)
+        if not mats:
+            self.report({'WARNING'}, "Path has no length")
+            return {'CANCELLED'}
+
+        if "tparch_template" in ob.data:
+            # the bays are meant to be edited together, they get their own
+            # copy of a template mesh, which split_edited leaves alone
+            arcade_me = ob.data.copy()
+            del arcade_me["tparch_template"]
+            ob.data = arcade_me
+            arch_templates.evict_unused()
+        ob.matrix_world = mats[0]
+        for mat in mats[1:]:
+            # bays share the arch's mesh, only the object is new
+            bay = bpy.data.objects.new(ob.name, ob.data)
+            bay.matrix_world = mat
+            if "tparch_pts" in ob:
+                bay["tparch_pts"] = list(ob["tparch_pts"])
+            context.scene.objects.link(bay)
+            bay.select = True
+        return {'FINISHED'}
+
+
 class TPARCH_PT_panel(bpy.types.Panel):
     # Creates a panel in the 3d view Toolshelf window
     bl_label = 'Arch Panel'
@@ -1465,17 +3423,360 @@ class TPARCH_PT_panel(bpy.types.Panel):
         #layout = self.layout
         row = self.layout.row(align=True)
         row.operator("view3d.modal_arch_tool", text="Create Arch", icon="SPHERECURVE")
+        row = self.layout.row(align=True)
+        row.operator("mesh.arch_add", text="Add Arch From Points")
+        row = self.layout.row(align=True)
+        row.operator("object.arch_arcade", text="Arcade From Active")
+
+
+# === Command line ===
+# Batch generation from a spec file, run with
+#   blender -b [project.blend] --python-exit-code 1
+#       --python three_point_arch.py --
+#       --input arches.json --output out.blend
+# The spec is a list of arches, or an object with an "arches" list. Each
+# arch gives p1, p2 and p3 and optionally segments, thickness, depth,
+# profile and name. Arches go on shared template meshes like the Add Arch
+# operator's, and a named arch is rebuilt on the mesh object already
+# called that, so a spec can be run again on its own output. Unnamed
+# arches always get new objects. Bad entries are reported and skipped,
+# the run then fails (exit code 1).
+
+# Checks one spec entry, returns (pts, segm_cnt, profile, thick, depth)
+# or raises ValueError saying what is wrong with it.
+def parse_spec_arch(arch):
+    if not isinstance(arch, dict):
+        raise ValueError("not an object")
+    try:
+        pts = [[float(c) for c in arch[key]] for key in ("p1", "p2", "p3")]
+        segm_cnt = arch.get("segments", 16)
+        thick = float(arch.get("thickness", 0.0))
+        depth = float(arch.get("depth", 0.0))
+    except KeyError as err:
+        raise ValueError("missing %s" % err)
+    except (TypeError, ValueError):
+        raise ValueError("points, thickness and depth must be numbers")
+    if any(len(p) != 3 for p in pts):
+        raise ValueError("points need 3 coordinates")
+    if not isinstance(segm_cnt, int) or isinstance(segm_cnt, bool) or \
+            segm_cnt < 2:
+        raise ValueError("segments must be a whole number of at least 2")
+    profile = arch.get("profile", 'CIRCULAR')
+    if not isinstance(profile, str) or profile not in PROFILES:
+        raise ValueError("unknown profile %r" % (profile,))
+    name = arch.get("name")
+    if name is not None and not isinstance(name, str):
+        raise ValueError("name must be a string")
+    return pts, segm_cnt, profile, thick, depth
+
+
+# Builds the arches of the spec file at spec_path into the current scene
+# and saves the file as out_path. Returns the number of arches that could
+# not be built, or 1 without saving when the spec has no arch list.
+def generate_from_spec(spec_path, out_path):
+    with open(spec_path) as f:
+        spec = json.load(f)
+    if isinstance(spec, dict):
+        spec = spec.get("arches")
+    if not isinstance(spec, list):
+        print("%s: expected a list of arches or an object with an "
+                "\"arches\" list" % spec_path)
+        return 1
+    failed = 0
+    names = set()
+    for i, arch in enumerate(spec):
+        try:
+            pts, segm_cnt, profile, thick, depth = parse_spec_arch(arch)
+            name = arch.get("name")
+            if name in names:
+                raise ValueError("name %r is used more than once" % name)
+        except ValueError as err:
+            print("arch %d: %s" % (i, err))
+            failed += 1
+            continue
+        ob = None
+        if name is not None:
+            names.add(name)
+            ob = bpy.data.objects.get(name)
+            if ob is not None and ob.type != 'MESH':
+                ob = None
+        ob = template_arch_object(pts[0], pts[1], pts[2], segm_cnt, profile,
+                thick, depth, ob)
+        if ob is None:
+            print("arch %d: cannot build a %s arch with %d segments from "
+                    "its points" % (i, profile, segm_cnt))
+            failed += 1
+        elif name is not None:
+            ob.name = name
+    arch_templates.evict_unused()
+    run_op(bpy.ops.wm.save_as_mainfile, filepath=bpy.path.abspath(out_path))
+    print("%d arches written to %s" % (len(spec) - failed, out_path))
+    return failed
+
+
+# === Benchmarks ===
+# Headless timings of arch generation and overlay drawing, run with
+#   blender -b --python-exit-code 1 --python three_point_arch.py --
+#       --benchmark [--baseline FILE [--save-baseline]]
+# Every result is the best of a few runs, the draw benchmarks also report
+# the batch and vertex counts of a frame. With a baseline file the run
+# fails (exit code 1) when a time is over tolerance times slower than its
+# stored time or a count is above its stored count, --save-baseline
+# writes the results as the new baseline.
+
+BENCH_SEGM_CNTS = (2, 16, 256, 4096, 100000)
+BENCH_BATCH_SIZES = (1, 10, 100, 1000, 10000)
+BENCH_GRID_SIZES = (100, 316, 1000)  # grid verts per side, 10k to 1M
+BENCH_DRAW_SEGM_CNTS = (16, 256, 4096)
+
+
+# Best time in seconds of repeat runs of func.
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        beg = perf_counter()
+        func()
+        secs = perf_counter() - beg
+        best = secs if best is None else min(best, secs)
+    return best
+
+
+def remove_object(ob):
+    me = ob.data
+    bpy.context.scene.objects.unlink(ob)
+    bpy.data.objects.remove(ob)
+    bpy.data.meshes.remove(me)
+
+
+def bench_arch_mesh(results, repeat):
+    pts = (-1.0, 0.0, 0.0), (1.0, 0.0, 0.0), (0.0, 0.0, 0.8)
+    for segm_cnt in BENCH_SEGM_CNTS:
+        def build():
+            arch = solve_arch(pts[0], pts[1], pts[2], segm_cnt)
+            verts, edges, faces = arch_solid_data(arch[3], arch[4], arch[2],
+                    0.1, 0.3)
+            me = bpy.data.meshes.new("bench")
+            write_mesh_data(me, verts, edges, faces)
+            bpy.data.meshes.remove(me)
+        results["arch_mesh segm %d" % segm_cnt] = best_time(build, repeat)
+
+
+def bench_batch(results, repeat):
+    rng = np.random.RandomState(0)
+    for size in BENCH_BATCH_SIZES:
+        pts = rng.uniform(-10, 10, (size, 3, 3))
+
+        def build():
+            remove_object(create_arches(pts, 16, 0.1, 0.3)[0])
+        results["batch %d arches" % size] = best_time(build, repeat)
+
+
+def bench_edit_insert(results, repeat):
+    scene = bpy.context.scene
+    arch = solve_arch((-1.0, 0.0, 1.0), (1.0, 0.0, 1.0), (0.0, 0.0, 1.8), 32)
+    state = SimpleNamespace(arch_pts=arch[3], arch_offs=arch[4],
+            piv_norm=Vector(arch[2]))
+    for side in BENCH_GRID_SIZES:
+        # a fresh grid for every run, inserts would otherwise go into the
+        # arches of the runs before
+        best = None
+        for _ in range(repeat):
+            me = bpy.data.meshes.new("bench_grid")
+            bm = bmesh.new()
+            bmesh.ops.create_grid(bm, x_segments=side - 1,
+                    y_segments=side - 1, size=10.0)
+            bm.to_mesh(me)
+            bm.free()
+            ob = bpy.data.objects.new("bench_grid", me)
+            scene.objects.link(ob)
+            scene.objects.active = ob
+            run_op(bpy.ops.object.mode_set, mode='EDIT')
+            secs = best_time(lambda: add_arch_to_edit_mesh(state, ob, 0.1,
+                    0.3), 1)
+            best = secs if best is None else min(best, secs)
+            run_op(bpy.ops.object.mode_set, mode='OBJECT')
+            remove_object(ob)
+        results["edit insert into %d verts" % (side * side)] = best
+
+
+# Draw callback cost per frame: draw_frame on a stub tool state placing
+# the third point, recording the arch preview, its measurement and the
+# HUD into a RecordingBackend. "rebuild" frames move the rise point so
+# the arch is solved and the overlay rebuilt every frame, "cached" frames
+# redraw the retained overlay. The batch and vertex counts of a frame go
+# into counts.
+def bench_draw(results, counts, repeat):
+    reg = SimpleNamespace(width=1920, height=1080)
+    # camera 6 units back along -y looking at the origin, 50 degree fov
+    focal = 1 / np.tan(np.radians(50) / 2)
+    near, far = 0.1, 100.0
+    proj_mat = np.array((
+        (focal * reg.height / reg.width, 0, 0, 0),
+        (0, focal, 0, 0),
+        (0, 0, (far + near) / (near - far), 2 * far * near / (near - far)),
+        (0, 0, -1, 0)))
+    view_mat = np.array((
+        (1, 0, 0, 0),
+        (0, 0, 1, 0),
+        (0, -1, 0, -6),
+        (0, 0, 0, 1)), dtype=np.float64)
+    rv3d = SimpleNamespace(perspective_matrix=np.dot(proj_mat,
+            view_mat).tolist())
+    proj = ViewProjector(reg, rv3d)
+    sett_dict = retreive_settings("def_blender_gray")
+    helpdisp = HelpDisplay(reg, sett_dict)
+    build_gui(helpdisp)
+    helpdisp.set_screen(gui_key(PLACE_3RD, False))
+    mean_dist = DrawMeanDistance(18, sett_dict, proj)
+    mean_dist.reg = reg
+    pts = [Vector((-1.0, 0.0, 0.0)), Vector((1.0, 0.0, 0.0))]
+    for segm_cnt in BENCH_DRAW_SEGM_CNTS:
+        snap = SimpleNamespace(co=Vector((0.0, 0.0, 0.8)))
+        snap.get_co = lambda ed_type, snap=snap: snap.co.copy()
+        state = SimpleNamespace(stage=PLACE_3RD, paused=False,
+                curr_ed_type='OBJECT', snap=snap, pts=pts,
+                cent=pts[0].lerp(pts[1], 0.5), profile='CIRCULAR',
+                segm_mode='COUNT', segm_cnt=segm_cnt, arch_key=None,
+                tess_key=None, tess_stats=None, bad_input=False,
+                arch_orig=None, direct_solid=False, proj=proj,
+                overlay=DrawList(), overlay_key=None,
+                draw_backend=RecordingBackend(), helpdisp=helpdisp,
+                mean_dist=mean_dist, meas_mult=1.0, meas_suff="")
+
+        def rebuild_frame():
+            snap.co.z = 1.61 - snap.co.z  # alternates 0.8 and 0.81
+            draw_frame(state)
+            state.draw_backend.end_frame()
+
+        def cached_frame():
+            draw_frame(state)
+            state.draw_backend.end_frame()
+
+        for name, frame in (("rebuild", rebuild_frame),
+                ("cached", cached_frame)):
+            key = "draw frame %s segm %d" % (name, segm_cnt)
+            results[key] = best_time(frame, repeat)
+            frame_cnts = state.draw_backend.frames[-1]
+            counts[key + " batches"] = frame_cnts["batches"]
+            counts[key + " verts"] = frame_cnts["verts"]
+
+
+# Runs every benchmark, returns (times, counts) where counts holds the
+# draw batch and vertex counts of the draw benchmarks.
+def run_benchmarks(repeat=3):
+    results = OrderedDict()
+    counts = OrderedDict()
+    for bench in (bench_arch_mesh, bench_batch, bench_edit_insert):
+        bench(results, repeat)
+    bench_draw(results, counts, repeat)
+    return results, counts
+
+
+# Returns the names of results over tolerance times slower than their
+# baseline time, results without a baseline are not compared.
+def compare_baseline(results, baseline, tolerance):
+    slower = []
+    for name, secs in results.items():
+        base = baseline.get(name)
+        if base is not None and secs > base * (1 + tolerance):
+            slower.append(name)
+    return slower
+
+
+# Returns the names of counts above their baseline count, the drawing is
+# deterministic so any growth is a regression.
+def compare_counts(counts, baseline):
+    return [name for name, cnt in counts.items()
+            if baseline.get(name) is not None and cnt > baseline[name]]
+
+
+# Command line entry point, argv is what follows "--" on Blender's
+# command line. Returns the process exit code.
+def main(argv):
+    parser = argparse.ArgumentParser(prog="three_point_arch.py")
+    parser.add_argument("--benchmark", action='store_true',
+            help="time arch generation and overlay drawing")
+    parser.add_argument("--repeat", type=int, default=3,
+            help="runs per benchmark, the best one counts")
+    parser.add_argument("--baseline", help="JSON file of baseline times")
+    parser.add_argument("--save-baseline", action='store_true',
+            help="store the results in the baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+            help="allowed slowdown against the baseline (0.5 = 50%%)")
+    parser.add_argument("--input", help="JSON spec file of arches to build")
+    parser.add_argument("--output", help=".blend file the arches are saved to")
+    args = parser.parse_args(argv)
+    if args.save_baseline and not args.baseline:
+        parser.error("--save-baseline needs --baseline")
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    if args.input:
+        if not args.output:
+            parser.error("--input needs --output")
+        return 1 if generate_from_spec(args.input, args.output) else 0
+    if not args.benchmark:
+        return 0
+
+    results, counts = run_benchmarks(args.repeat)
+    baseline = {"times": {}, "counts": {}}
+    if args.baseline and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    base_times = baseline.get("times", {})
+    base_counts = baseline.get("counts", {})
+    for name, secs in results.items():
+        base = base_times.get(name)
+        cmp_str = ""
+        if base is not None:
+            cmp_str = "  (baseline %.3f ms)" % (base * 1000)
+        print("%-40s %10.3f ms%s" % (name, secs * 1000, cmp_str))
+    for name, cnt in counts.items():
+        base = base_counts.get(name)
+        cmp_str = ""
+        if base is not None:
+            cmp_str = "  (baseline %d)" % base
+        print("%-40s %10d%s" % (name, cnt, cmp_str))
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({"times": results, "counts": counts}, f, indent=2)
+        return 0
+    slower = compare_baseline(results, base_times, args.tolerance)
+    grown = compare_counts(counts, base_counts)
+    if slower:
+        print("\nREGRESSION: %d benchmarks over %d%% slower than baseline:"
+                % (len(slower), args.tolerance * 100))
+        for name in slower:
+            print("  " + name)
+    if grown:
+        print("\nREGRESSION: %d draw counts above baseline:" % len(grown))
+        for name in grown:
+            print("  " + name)
+    return 1 if slower or grown else 0
 
 
 def register():
     bpy.utils.register_class(TPARCH_prefs)
     bpy.utils.register_class(TPARCH_OT_modal)
+    bpy.utils.register_class(TPARCH_OT_add)
+    bpy.utils.register_class(TPARCH_arch_row)
+    bpy.utils.register_class(TPARCH_OT_batch)
+    bpy.utils.register_class(TPARCH_OT_arcade)
     bpy.utils.register_class(TPARCH_PT_panel)
+    bpy.app.handlers.scene_update_post.append(split_edited_template)
 
 def unregister():
+    bpy.app.handlers.scene_update_post.remove(split_edited_template)
     bpy.utils.unregister_class(TPARCH_PT_panel)
+    bpy.utils.unregister_class(TPARCH_OT_arcade)
+    bpy.utils.unregister_class(TPARCH_OT_batch)
+    bpy.utils.unregister_class(TPARCH_arch_row)
+    bpy.utils.unregister_class(TPARCH_OT_add)
     bpy.utils.unregister_class(TPARCH_OT_modal)
     bpy.utils.unregister_class(TPARCH_prefs)
 
 if __name__ == "__main__":
     register()
+    if "--" in sys.argv:
+        exit_code = main(sys.argv[sys.argv.index("--") + 1:])
+        if exit_code:
+            sys.exit(exit_code)